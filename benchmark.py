@@ -0,0 +1,496 @@
+'''
+Micro-benchmarks for the chess engine in chess.py.
+
+usage: python benchmark.py [name ...] [--depth N]
+Runs every benchmark when no name is given.
+'''
+import os
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+import chess
+import compile_book
+
+SQUARES = [ 0b1 << i for i in range(64) ]
+
+def throughput(function, calls, min_seconds=0.5):
+    '''Calls function() until min_seconds have passed; returns calls per second.'''
+    rounds = 0
+    start_time = perf_counter()
+    while True:
+        function()
+        rounds += 1
+        elapsed = perf_counter() - start_time
+        if elapsed >= min_seconds:
+            return rounds*calls/elapsed
+
+def report(name, before, after):
+    print('{:<24} before {:>12,.0f}/s   after {:>12,.0f}/s   x{:.1f}'.format(name, before, after, after/before))
+
+# ========== ATTACK TABLES ==========
+
+def bench_attacks():
+    board = chess.Game().board
+
+    report('knight attacks',
+           throughput(lambda: [chess.knight_shift_attacks(sq) for sq in SQUARES], 64),
+           throughput(lambda: [chess.knight_attacks(sq) for sq in SQUARES], 64))
+    report('king attacks',
+           throughput(lambda: [chess.king_shift_attacks(sq) for sq in SQUARES], 64),
+           throughput(lambda: [chess.king_attacks(sq) for sq in SQUARES], 64))
+    report('pawn attacks',
+           throughput(lambda: [chess.pawn_east_attacks(sq, board, chess.WHITE) | chess.pawn_west_attacks(sq, board, chess.WHITE) for sq in SQUARES], 64),
+           throughput(lambda: [chess.pawn_attacks(sq, board, chess.WHITE) for sq in SQUARES], 64))
+
+# ========== SLIDING ATTACKS ==========
+
+SLIDING_CORPUS_SIZE = 2000
+SLIDING_FUNCTIONS = [ chess.bishop_attacks, chess.rook_attacks, chess.queen_attacks, chess.joker_attacks ]
+
+def random_boards(count, seed=0):
+    '''Boards with a random piece on each square, at a random density per board.'''
+    rand = Random(seed)
+    pieces = [ color|piece for color in [chess.WHITE, chess.BLACK] for piece in chess.PIECE_TYPES ]
+    boards = []
+    for _ in range(count):
+        density = rand.random()
+        boards.append(chess.Board([ rand.choice(pieces) if rand.random() < density else chess.EMPTY for _ in range(64) ]))
+    return boards
+
+def sliding_attacks(boards, from_tables):
+    chess.sliding_attacks_from_tables = from_tables
+    try:
+        return [ [ function(sq, board, chess.WHITE) for sq in SQUARES for function in SLIDING_FUNCTIONS ] for board in boards ]
+    finally:
+        chess.sliding_attacks_from_tables = True
+
+def bench_sliding():
+    boards = random_boards(SLIDING_CORPUS_SIZE)
+    if sliding_attacks(boards, True) != sliding_attacks(boards, False):
+        sys.exit('sliding attack tables disagree with the ray attacks')
+    print('tables match rays on {} random boards'.format(len(boards)))
+
+    sample = boards[:20]
+    calls = len(sample)*len(SQUARES)*len(SLIDING_FUNCTIONS)
+    report('sliding attacks',
+           throughput(lambda: sliding_attacks(sample, False), calls),
+           throughput(lambda: sliding_attacks(sample, True), calls))
+
+# ========== PERFT ==========
+
+# (name, FEN, node counts by depth). The engine only promotes to queens, so positions with
+# promotions in reach (positions 4 and 5, Kiwipete from depth 4) count fewer nodes than the
+# published tables; these counts come from an independent move generator restricted to
+# queen promotions, not from this engine.
+PERFT_POSITIONS = [ ('initial',    chess.INITIAL_FEN,
+                     [20, 400, 8902, 197281]),
+                    ('kiwipete',   'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                     [48, 2039, 97862, 4074224]),
+                    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                     [14, 191, 2812, 43238, 674624]),
+                    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                     [6, 228, 8087, 320802]),
+                    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+                     [41, 1373, 54007, 1806790]),
+                    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+                     [46, 2079, 89890, 3894594]) ]
+PERFT_DEPTH = 3
+
+def bench_perft(depth=PERFT_DEPTH):
+    failed = False
+    total_nodes = 0
+    total_time = 0
+    for name, FEN, node_counts in PERFT_POSITIONS:
+        game = chess.Game(FEN)
+        position_depth = min(depth, len(node_counts))
+        start_time = perf_counter()
+        nodes = chess.perft(game, position_depth)
+        elapsed = perf_counter() - start_time
+        total_nodes += nodes
+        total_time += elapsed
+        
+        expected = node_counts[position_depth-1]
+        status = 'ok' if nodes == expected else 'FAILED, expected {}'.format(expected)
+        failed |= nodes != expected
+        print('{:<12} depth {}  {:>9} nodes  {:>8.2f}s  {:>9,.0f} nodes/s  {}'.format(name, position_depth, nodes, elapsed, nodes/elapsed, status))
+    print('total {} nodes in {:.2f}s, {:,.0f} nodes/s'.format(total_nodes, total_time, total_nodes/total_time))
+    if failed:
+        sys.exit('perft node counts diverged')
+
+# ========== EVALUATION ==========
+
+def full_evaluation(game):
+    '''Material and positional score recomputed square by square, without running totals or the pawn table.'''
+    return chess.material_sum(game.board, chess.WHITE) - chess.material_sum(game.board, chess.BLACK) + \
+           chess.positional_bonus(game, chess.WHITE) - chess.positional_bonus(game, chess.BLACK) + \
+           chess.pawn_structure(game.board)[0]
+
+def incremental_evaluation(game):
+    return chess.material_balance(game.board) + chess.positional_balance(game)
+
+def bench_evaluation():
+    games = [ chess.Game(FEN) for _, FEN, _ in PERFT_POSITIONS ]
+    if [ full_evaluation(game) for game in games ] != [ incremental_evaluation(game) for game in games ]:
+        sys.exit('running evaluation totals disagree with the full evaluation')
+    report('static evaluation',
+           throughput(lambda: [full_evaluation(game) for game in games], len(games)),
+           throughput(lambda: [incremental_evaluation(game) for game in games], len(games)))
+
+# ========== VECTORIZED EVALUATION ==========
+
+VECTORIZED_GAMES = 2000
+VECTORIZED_PLIES = 120
+
+def random_games(count, plies, seed=0):
+    '''Positions along random games, one every few plies.'''
+    rand = Random(seed)
+    games = []
+    while len(games) < count:
+        game = chess.Game()
+        for ply in range(plies):
+            moves = list(chess.generate_legal_moves(game, game.to_move))
+            if not moves:
+                break
+            game.push(rand.choice(moves))
+            if ply % 8 == 7:
+                games.append(game.copy())
+    return games[:count]
+
+def bench_vectorized():
+    if chess.np is None:
+        print('NumPy is not installed')
+        return
+    games = random_games(VECTORIZED_GAMES, VECTORIZED_PLIES)
+    boards = chess.pack_boards(game.board for game in games)
+    if [ incremental_evaluation(game) for game in games ] != chess.vectorized_evaluation(boards).tolist():
+        sys.exit('vectorized evaluation disagrees with the running totals')
+    print('vectorized evaluation matches on {} positions'.format(len(games)))
+    report('bulk evaluation',
+           throughput(lambda: [incremental_evaluation(game) for game in games], len(games)),
+           throughput(lambda: chess.vectorized_evaluation(chess.pack_boards(game.board for game in games)), len(games)))
+    report('bulk evaluation, packed',
+           throughput(lambda: [incremental_evaluation(game) for game in games], len(games)),
+           throughput(lambda: chess.vectorized_evaluation(boards), len(games)))
+
+# ========== FEN ==========
+
+def concatenated_FEN(game):
+    '''FEN built square by square with += and format(), as Game.to_FEN used to.'''
+    FEN_str = ''
+    for i in range(8):
+        first = 64 - 8*(i+1)
+        empty_sqrs = 0
+        for fille in range(8):
+            piece = game.board[first+fille]
+            if piece&chess.PIECE_MASK == chess.EMPTY:
+                empty_sqrs += 1
+            else:
+                if empty_sqrs > 0:
+                    FEN_str += '{}'.format(empty_sqrs)
+                FEN_str += '{}'.format(chess.piece2str(piece))
+                empty_sqrs = 0
+        if empty_sqrs > 0:
+            FEN_str += '{}'.format(empty_sqrs)
+        FEN_str += '/'
+    FEN_str = FEN_str[:-1] + ' '
+    FEN_str += 'w ' if game.to_move == chess.WHITE else 'b '
+    for flag in 'KQkq':
+        if game.castling_rights & chess.FEN_CASTLING_FLAGS[flag]:
+            FEN_str += flag
+    if game.castling_rights == 0:
+        FEN_str += '-'
+    FEN_str += ' '
+    FEN_str += '-' if game.ep_square == 0 else chess.bb2str(game.ep_square)
+    FEN_str += ' {}'.format(game.halfmove_clock)
+    FEN_str += ' {}'.format(game.fullmove_number)
+    return FEN_str
+
+def character_squares(FEN_str):
+    '''Squares read from a FEN one character at a time, as Game.load_FEN used to.'''
+    rank_list = FEN_str.split(' ')[0].split('/')
+    rank_list.reverse()
+    squares = []
+    for rank in rank_list:
+        for p in rank:
+            if p.isdigit():
+                for _ in range(int(p)):
+                    squares.append(chess.EMPTY)
+            else:
+                squares.append(chess.str2piece(p))
+    return squares
+
+def uncached_FEN(game):
+    game.FEN_cache = None
+    return game.to_FEN()
+
+def bench_FEN():
+    games = [ chess.Game(FEN) for _, FEN, _ in PERFT_POSITIONS ]
+    FENs = [ FEN for _, FEN, _ in PERFT_POSITIONS ]
+    placements = [ FEN.split(' ')[0] for FEN in FENs ]
+    if [ concatenated_FEN(game) for game in games ] != FENs or [ uncached_FEN(game) for game in games ] != FENs or \
+       [ character_squares(FEN) for FEN in FENs ] != [ chess.FEN2squares(placement) for placement in placements ]:
+        sys.exit('FEN encoder or decoder disagrees with the character by character one')
+    report('to_FEN',
+           throughput(lambda: [concatenated_FEN(game) for game in games], len(games)),
+           throughput(lambda: [uncached_FEN(game) for game in games], len(games)))
+    report('to_FEN, cached',
+           throughput(lambda: [concatenated_FEN(game) for game in games], len(games)),
+           throughput(lambda: [game.to_FEN() for game in games], len(games)))
+    report('FEN placement',
+           throughput(lambda: [character_squares(FEN) for FEN in FENs], len(FENs)),
+           throughput(lambda: [chess.FEN2squares(placement) for placement in placements], len(FENs)))
+    report('FEN to Board',
+           throughput(lambda: [chess.Board(character_squares(FEN)) for FEN in FENs], len(FENs)),
+           throughput(lambda: [chess.FEN2board(placement) for placement in placements], len(FENs)))
+
+# ========== OPENING BOOK ==========
+
+# the second line reaches the end of the first by another move order, so it must find f1b5 there
+BOOK_LINES = [ 'e2e4 e7e5 g1f3 b8c6',
+               'g1f3 b8c6 e2e4 e7e5 f1b5' ]
+BOOK_TRANSPOSITION = [ 'e2e4', 'e7e5', 'g1f3', 'b8c6' ]
+
+def transposed_game():
+    game = chess.Game()
+    for move in BOOK_TRANSPOSITION:
+        game.push(chess.uci2move(move))
+    return game
+
+def bench_book():
+    text_book = chess.OpeningBook(BOOK_LINES)
+    game = transposed_game()
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, 'book.txt')
+        binary_path = os.path.join(directory, 'book.bin')
+        with open(text_path, 'w') as text_file:
+            text_file.write('\n'.join(BOOK_LINES))
+        compile_book.compile_book([text_path], [], binary_path)
+        with open(binary_path, 'rb') as binary_file:
+            binary_book = chess.BinaryOpeningBook(binary_file)
+            for name, book in [('text', text_book), ('binary', binary_book)]:
+                moves = [ chess.move2uci(chess.pack_move(move)) for move in book.get_moves(game) ]
+                if moves != ['f1b5']:
+                    sys.exit('{} book found {} after a transposition, expected f1b5'.format(name, moves))
+                print('{:<7} book  {:>10,.0f} lookups/s  transposition ok'.format(
+                      name, throughput(lambda: book.get_moves(game), 1)))
+            binary_book.book.close()
+
+# ========== MOVE ORDERING ==========
+
+ORDERING_POSITIONS = [ 'initial', 'kiwipete', 'position 6' ]
+ORDERING_DEPTH = 3
+
+def searched_nodes(FEN, depth, ordered):
+    '''Runs a full-width iterative deepening with a fresh transposition table; returns [score, nodes, seconds].'''
+    chess.move_ordering = ordered
+    try:
+        start_time = perf_counter()
+        [_, score, iterations] = chess.iterative_deepening(chess.Game(FEN), depth, table=chess.TranspositionTable(),
+                                                           options=chess.FULL_WIDTH_SEARCH)
+        return [score, sum(iteration.nodes for iteration in iterations), perf_counter() - start_time]
+    finally:
+        chess.move_ordering = True
+
+def bench_ordering(depth=ORDERING_DEPTH):
+    for name, FEN, _ in PERFT_POSITIONS:
+        if name not in ORDERING_POSITIONS:
+            continue
+        [plain_score, plain_nodes, plain_time] = searched_nodes(FEN, depth, False)
+        [score, nodes, elapsed] = searched_nodes(FEN, depth, True)
+        if score != plain_score:
+            sys.exit('{}: ordered search scored {}, unordered {}'.format(name, score, plain_score))
+        print('{:<12} depth {}  unordered {:>7} nodes {:>6.2f}s   ordered {:>7} nodes {:>6.2f}s   {:.0%} of the nodes'.format(
+              name, depth, plain_nodes, plain_time, nodes, elapsed, nodes/plain_nodes))
+
+# ========== PARALLEL SEARCH ==========
+
+PARALLEL_POSITIONS = [ 'kiwipete', 'position 6' ]
+PARALLEL_DEPTH = 3
+WORKER_COUNTS = sorted({ 1, 2, 4, os.cpu_count() or 1 })
+
+def timed_search(FEN, depth, workers):
+    start_time = perf_counter()
+    if workers is None:
+        [_, score, iterations] = chess.iterative_deepening(chess.Game(FEN), depth, table=chess.TranspositionTable(),
+                                                           options=chess.FULL_WIDTH_SEARCH)
+    else:
+        [_, score, iterations] = chess.parallel_search(chess.Game(FEN), depth, workers, options=chess.FULL_WIDTH_SEARCH)
+    return [score, sum(iteration.nodes for iteration in iterations), perf_counter() - start_time]
+
+def bench_parallel(depth=PARALLEL_DEPTH):
+    print('{} CPUs'.format(os.cpu_count()))
+    for name, FEN, _ in PERFT_POSITIONS:
+        if name not in PARALLEL_POSITIONS:
+            continue
+        [serial_score, nodes, serial_time] = timed_search(FEN, depth, None)
+        print('{:<12} depth {}  serial     {:>7} nodes {:>6.2f}s'.format(name, depth, nodes, serial_time))
+        for workers in WORKER_COUNTS:
+            [score, nodes, elapsed] = timed_search(FEN, depth, workers)
+            if score != serial_score:
+                sys.exit('{}: parallel search scored {} on {} workers, serial {}'.format(name, score, workers, serial_score))
+            print('{:<12} depth {}  {:>2} workers {:>7} nodes {:>6.2f}s   x{:.2f}'.format(
+                  name, depth, workers, nodes, elapsed, serial_time/elapsed))
+
+# ========== SELECTIVE SEARCH ==========
+
+SELECTIVE_POSITIONS = [ 'initial', 'kiwipete', 'position 6' ]
+SELECTIVE_DEPTH = 4
+SELECTIVE_OPTIONS = [ ('full width',          chess.FULL_WIDTH_SEARCH),
+                      ('null move',           chess.FULL_WIDTH_SEARCH._replace(null_move=True)),
+                      ('late move reduction', chess.FULL_WIDTH_SEARCH._replace(late_move_reductions=True)),
+                      ('check extensions',    chess.FULL_WIDTH_SEARCH._replace(check_extensions=True)),
+                      ('all',                 chess.SELECTIVE_SEARCH) ]
+
+# passing, moving a knight out, passing and moving it back is not a repetition, nor does it run the clock
+NULL_REPETITION_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR b KQkq - 0 1'
+NULL_REPETITION_MOVES = [ 'g1f3', 'f3g1' ]
+
+def check_null_repetition():
+    game = chess.Game(NULL_REPETITION_FEN)
+    for move in NULL_REPETITION_MOVES:
+        game.push_null()
+        game.push(chess.uci2move(move))
+    if chess.is_repetition(game) or game.halfmove_clock > len(NULL_REPETITION_MOVES):
+        sys.exit('null moves counted towards a repetition or the halfmove clock')
+
+def bench_selective(depth=SELECTIVE_DEPTH):
+    check_null_repetition()
+    for name, FEN, _ in PERFT_POSITIONS:
+        if name not in SELECTIVE_POSITIONS:
+            continue
+        for options_name, options in SELECTIVE_OPTIONS:
+            start_time = perf_counter()
+            [move, score, iterations] = chess.iterative_deepening(chess.Game(FEN), depth, table=chess.TranspositionTable(),
+                                                                  options=options)
+            elapsed = perf_counter() - start_time
+            print('{:<12} depth {}  {:<20} {:>8} nodes {:>7.2f}s   {} ({})'.format(
+                  name, depth, options_name, sum(iteration.nodes for iteration in iterations), elapsed, chess.move2uci(move), score))
+
+# ========== MEMORY ==========
+
+MEMORY_GAMES = 200
+MEMORY_PLIES = [ 0, 40, 160 ]
+
+# the layout a Game had before it was slotted (as of the NumPy evaluator), for the "before" column:
+# a board that is a list of squares with its bitboards in an instance __dict__, lists of packed
+# moves and Zobrist keys, and a list of undo tuples
+class ListBoard(list):
+    def __init__(self, board):
+        list.__init__(self, board)
+        self.piece_bb = list(board.piece_bb)
+        self.color_bb = list(board.color_bb)
+        self.occupied = board.occupied
+        self.zobrist = board.zobrist
+        self.pawn_zobrist = board.pawn_zobrist
+        self.material = board.material
+        self.piece_square = board.piece_square
+
+class ListGame:
+    def __init__(self, moves):
+        '''Replays moves into the old layout, appending to its histories one ply at a time as push did.'''
+        game = chess.Game()
+        self.key_history = [game.zobrist_key()]
+        self.move_history = []
+        self.undo_stack = []
+        for move in moves:
+            game.push(move)
+            undo = undo_tuple(game.undo_stack[-1], move)
+            self.undo_stack.append(undo)
+            self.move_history.append(undo[0])
+            self.key_history.append(game.zobrist_key())
+        self.board = ListBoard(game.board)
+        self.to_move = game.to_move
+        self.ep_square = game.ep_square
+        self.castling_rights = game.castling_rights
+        self.halfmove_clock = game.halfmove_clock
+        self.fullmove_number = game.fullmove_number
+        self.transposition_table = None
+        self.pawn_table = None
+        self.status_cache = None
+        self.FEN_cache = None
+
+def undo_tuple(undo, pushed_move):
+    '''A packed undo record spread over a tuple, as pop() used to read it, holding pushed_move itself unless promoted.'''
+    move = undo & 0x7FFF
+    if move == pushed_move:
+        move = pushed_move
+    moving_piece = undo >> chess.UNDO_MOVING_SHIFT & 0xF
+    ep_index = undo >> chess.UNDO_EP_SQUARE_SHIFT & 0x3F
+    ep_capture = None
+    if undo & chess.UNDO_EP_CAPTURE:
+        ep_capture = (chess.ep_pawn_index(ep_index), undo >> chess.UNDO_EP_PIECE_SHIFT & 0xF)
+    castle_rook = None
+    if undo & chess.UNDO_CASTLE:
+        castle_rook = chess.CASTLE_ROOK_MOVES[(moving_piece, move & 0x3F, move >> 6 & 0x3F)] + \
+                      (undo >> chess.UNDO_ROOK_SHIFT & 0xF,)
+    return (move, moving_piece, undo >> chess.UNDO_CAPTURED_SHIFT & 0xF, ep_capture, castle_rook,
+            undo >> chess.UNDO_CASTLING_SHIFT & 0xF, chess.SQUARE_BBS[ep_index] if ep_index else 0,
+            undo >> chess.UNDO_HALFMOVE_SHIFT)
+
+def replay(moves):
+    game = chess.Game()
+    for move in moves:
+        game.push(move)
+    return game
+
+def traced_memory(build, items):
+    '''Bytes still allocated per item after build has been called on each of them.'''
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    built = [ build(item) for item in items ]
+    memory = tracemalloc.get_traced_memory()[0] - start_memory
+    tracemalloc.stop()
+    return memory/len(built)
+
+def bench_memory():
+    rand = Random(0)
+    for plies in MEMORY_PLIES:
+        lines = []
+        while len(lines) < MEMORY_GAMES:
+            game = chess.Game()
+            for _ in range(plies):
+                moves = list(chess.generate_legal_moves(game, game.to_move))
+                if not moves:
+                    break
+                game.push(rand.choice(moves))
+            if len(game.move_history) == plies:
+                lines.append(list(game.move_history))
+        before = traced_memory(ListGame, lines)
+        after = traced_memory(replay, lines)
+        print('{:>4} plies  before {:>8,.0f}  after {:>8,.0f} bytes per game'.format(plies, before, after))
+
+# ===================================
+
+BENCHMARKS = { 'attacks':    bench_attacks,
+               'sliding':    bench_sliding,
+               'perft':      bench_perft,
+               'evaluation': bench_evaluation,
+               'vectorized': bench_vectorized,
+               'FEN':        bench_FEN,
+               'book':       bench_book,
+               'ordering':   bench_ordering,
+               'parallel':   bench_parallel,
+               'selective':  bench_selective,
+               'memory':     bench_memory }
+DEPTH_OPTION = [ 'perft', 'ordering', 'parallel', 'selective' ]
+
+def main(names, depth=None):
+    for name in names or BENCHMARKS:
+        print('--- {} ---'.format(name))
+        if depth is not None and name in DEPTH_OPTION:
+            BENCHMARKS[name](depth)
+        else:
+            BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Micro-benchmarks for the chess engine.')
+    parser.add_argument('names', nargs='*', help='benchmarks to run: {} (default: all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--depth', type=int, help='search depth for the benchmarks that take one')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {}'.format(name))
+    main(args.names, args.depth)
@@ -20,11 +20,40 @@ bit_boards = 0b(h8)(g8)...(b1)(a1)
 board = [ a1, b1, ..., g8, h8 ]
 
 move = [ leaving_position, arriving_position ]
+packed move = 0bPPPTTTTTTLLLLLL, used inside the engine
+where:
+P - promotion piece code (0 if none)
+T - arriving square index
+L - leaving square index
+
+undo record = 0bHHHHHHHHHHHHHHHHHHHHHEEEEEERRRRCCCCcPPPPpVVVVMMMMmmmmmmmmmmmmmmm, one per move in Game.undo_stack
+where:
+H - halfmove clock before the move
+E - en passant square index before the move (0 if none)
+R - castling rights before the move
+C, c - rook moved by castling, and whether the move castled
+P, p - pawn taken en passant, and whether the move took one
+V - captured piece
+M - moving piece
+m - packed move
 
 '''
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from array import array
 from copy import deepcopy
-from random import choice
+from itertools import islice
+from mmap import mmap, ACCESS_READ
+from multiprocessing import Value
+from random import choice, choices, Random
+from struct import Struct
 from time import sleep, time
+from zlib import decompress
+
+try:
+    import numpy as np
+except ImportError: # only vectorized_evaluation needs it
+    np = None
 
 COLOR_MASK = 1 << 3
 WHITE = 0 << 3
@@ -55,6 +84,14 @@ CASTLE_QUEENSIDE_BLACK = 0b1 << 3
 
 FULL_CASTLING_RIGHTS = CASTLE_KINGSIDE_WHITE|CASTLE_QUEENSIDE_WHITE|CASTLE_KINGSIDE_BLACK|CASTLE_QUEENSIDE_BLACK
 
+# castling rights lost when a piece leaves or is captured on these squares (indexes of a1, h1, a8, h8)
+CASTLING_RIGHTS_LOST = { 0:  CASTLE_QUEENSIDE_WHITE,
+                         7:  CASTLE_KINGSIDE_WHITE,
+                         56: CASTLE_QUEENSIDE_BLACK,
+                         63: CASTLE_KINGSIDE_BLACK }
+KING_CASTLING_RIGHTS = { WHITE: CASTLE_KINGSIDE_WHITE|CASTLE_QUEENSIDE_WHITE,
+                         BLACK: CASTLE_KINGSIDE_BLACK|CASTLE_QUEENSIDE_BLACK }
+
 ALL_SQUARES    = 0xFFFFFFFFFFFFFFFF
 FILE_A         = 0x0101010101010101
 FILE_B         = 0x0202020202020202
@@ -91,7 +128,17 @@ INITIAL_BOARD = [ WHITE|ROOK, WHITE|KNIGHT, WHITE|BISHOP, WHITE|QUEEN, WHITE|KIN
 
 EMPTY_BOARD = [ EMPTY for _ in range(64) ]
 
+# (king, king leaving index, king arriving index) -> (rook leaving index, rook arriving index)
+CASTLE_ROOK_MOVES = { (WHITE|KING, 4, 6):   (7, 5),
+                      (WHITE|KING, 4, 2):   (0, 3),
+                      (BLACK|KING, 60, 62): (63, 61),
+                      (BLACK|KING, 60, 58): (56, 59) }
+
 INITIAL_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+BOOK_FILE = 'book.txt'
+BINARY_BOOK_FILE = 'book.bin'
+BOOK_ENTRY = Struct('>QHH') # Zobrist key, from_index | to_index << 6, weight; sorted by key
+TABLEBASE_FILE = 'tablebase.bin'
 STROKES_YOLO = '1k6/2b1p3/Qp4N1/4r2P/2B2q2/1R6/2Pn2K1/8 w - - 0 1'
 
 PIECE_CODES = { WHITE|KING:  'K',
@@ -111,6 +158,16 @@ PIECE_CODES = { WHITE|KING:  'K',
                 EMPTY:       '.' }
 PIECE_CODES.update({v: k for k, v in PIECE_CODES.items()})
 
+FEN_PIECES = [ '1' if piece&PIECE_MASK == EMPTY else PIECE_CODES[piece] for piece in range(16) ]
+FEN_EMPTY_RUNS = [ ('1'*length, str(length)) for length in range(8, 1, -1) ]
+FEN_EXPAND_EMPTY = str.maketrans({ str(length): '.'*length for length in range(1, 9) })
+FEN_CASTLING_FLAGS = { 'K': CASTLE_KINGSIDE_WHITE,
+                       'Q': CASTLE_QUEENSIDE_WHITE,
+                       'k': CASTLE_KINGSIDE_BLACK,
+                       'q': CASTLE_QUEENSIDE_BLACK }
+FEN_CASTLING = [ ''.join(flag for flag in 'KQkq' if rights & FEN_CASTLING_FLAGS[flag]) or '-' for rights in range(16) ]
+FEN_TO_MOVE = { WHITE: 'w', BLACK: 'b', 'w': WHITE, 'b': BLACK }
+
 DOUBLED_PAWN_PENALTY      = 10
 ISOLATED_PAWN_PENALTY     = 20
 BACKWARDS_PAWN_PENALTY    = 8
@@ -164,120 +221,432 @@ KING_ENDGAME_BONUS = [ 0,  10,  20,  30,  30,  20,  10,   0,
                       10,  20,  30,  40,  40,  30,  20,  10,
                        0,  10,  20,  30,  30,  20,  10,   0]
 
+# white-minus-black score of a piece on a square: its material and its bonus (kings score theirs in positional_balance)
+SQUARE_BONUS = { PAWN: PAWN_BONUS, KNIGHT: KNIGHT_BONUS, BISHOP: BISHOP_BONUS }
+MATERIAL_SCORES = [ PIECE_VALUES[piece&PIECE_MASK] if piece&COLOR_MASK == WHITE else -PIECE_VALUES[piece&PIECE_MASK]
+                    for piece in range(16) ]
+PIECE_SQUARE_SCORES = [ [ 0 if piece&PIECE_MASK not in SQUARE_BONUS else
+                          SQUARE_BONUS[piece&PIECE_MASK][index] if piece&COLOR_MASK == WHITE else
+                          -SQUARE_BONUS[piece&PIECE_MASK][index ^ 56] for index in range(64) ] for piece in range(16) ]
+
+ZOBRIST_SEED = 2016
+_zobrist_random = Random(ZOBRIST_SEED)
+ZOBRIST_PIECES = [ [ _zobrist_random.getrandbits(64) if piece&PIECE_MASK != EMPTY else 0 for _ in range(64) ] for piece in range(16) ]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+_zobrist_castling_bits = [ _zobrist_random.getrandbits(64) for _ in range(4) ]
+ZOBRIST_CASTLING = [ 0 for _ in range(16) ]
+for rights in range(16):
+    for bit in range(4):
+        if rights & (0b1 << bit):
+            ZOBRIST_CASTLING[rights] ^= _zobrist_castling_bits[bit]
+ZOBRIST_EP = { 0b1 << i: _zobrist_random.getrandbits(64) for i in range(64) }
+ZOBRIST_EP[0] = 0
+ZOBRIST_PAWNS = [ ZOBRIST_PIECES[piece] if piece&PIECE_MASK == PAWN else [0]*64 for piece in range(16) ]
+
+GameStatus = namedtuple('GameStatus', ['ended', 'outcome', 'in_check', 'legal_move_count'])
+TablebaseEntry = namedtuple('TablebaseEntry', ['outcome', 'plies']) # outcome for the side to move: 1 win, 0 draw, -1 loss
+PositionAnalysis = namedtuple('PositionAnalysis', ['FEN', 'evaluation', 'legal_move_count', 'in_check', 'ended', 'outcome', 'error'],
+                              defaults=[None]) # error: why the FEN could not be read, with the other fields None
+SearchOptions = namedtuple('SearchOptions', ['null_move', 'late_move_reductions', 'check_extensions'])
+SELECTIVE_SEARCH = SearchOptions(True, True, True)
+FULL_WIDTH_SEARCH = SearchOptions(False, False, False) # every move to the full depth, as plain alpha-beta
+
+TABLEBASE_PIECES = [ QUEEN, ROOK, PAWN ] # one table per piece a king can have against a lone king
+TABLEBASE_SIZE = 2*64*64*64
+
+TT_SIZE = 1 << 16
+PAWN_TABLE_SIZE = 1 << 14
+ANALYSIS_CHUNK_SIZE = 256 # positions per work unit sent to an analysis worker
+UNDO_MOVING_SHIFT     = 15
+UNDO_CAPTURED_SHIFT   = 19
+UNDO_EP_CAPTURE       = 0b1 << 23
+UNDO_EP_PIECE_SHIFT   = 24
+UNDO_CASTLE           = 0b1 << 28
+UNDO_ROOK_SHIFT       = 29
+UNDO_CASTLING_SHIFT   = 33
+UNDO_EP_SQUARE_SHIFT  = 37
+UNDO_HALFMOVE_SHIFT   = 43
+
+EXACT_BOUND = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
 verbose = False
+sliding_attacks_from_tables = True # False walks rays with the *_ray_attacks functions instead
+move_ordering = True # False searches moves in generation order, after the transposition table move
+
+KILLER_SLOTS = 2
+QUIESCENCE_DEPTH = 4 # captures searched past the nominal depth
+DELTA_MARGIN = 200 # captures that cannot lift the score this close to the bound are skipped
+NULL_MOVE = 0 # a1a1, which leaves the board as it is
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+LATE_MOVE_NUMBER = 3 # moves searched at full depth before reductions start
+LATE_MOVE_MIN_DEPTH = 3
 
 # ========== CHESS GAME ==========
 
+class Board(bytearray):
+    '''
+    64-byte mailbox of piece codes that keeps bitboards in sync with its squares:
+    piece_bb[piece] - squares holding that colored piece (piece_bb[EMPTY] are the empty squares)
+    color_bb[color >> 3] - squares holding pieces of that color
+    occupied - squares holding any piece
+    zobrist - Zobrist hash of the piece placement
+    pawn_zobrist - Zobrist hash of the pawns alone
+    material, piece_square - white-minus-black material and piece-square bonuses
+    '''
+    __slots__ = ('piece_bb', 'color_bb', 'occupied', 'zobrist', 'pawn_zobrist', 'material', 'piece_square')
+    
+    def __init__(self, squares=EMPTY_BOARD):
+        bytearray.__init__(self, squares)
+        piece_bb = [0]*16
+        zobrist = pawn_zobrist = material = piece_square = 0
+        for index, piece in enumerate(self):
+            piece_bb[piece] |= SQUARE_BBS[index]
+            if piece != EMPTY: # empty squares hash and score to 0
+                zobrist ^= ZOBRIST_PIECES[piece][index]
+                pawn_zobrist ^= ZOBRIST_PAWNS[piece][index]
+                material += MATERIAL_SCORES[piece]
+                piece_square += PIECE_SQUARE_SCORES[piece][index]
+        self.piece_bb = piece_bb
+        self.zobrist = zobrist
+        self.pawn_zobrist = pawn_zobrist
+        self.material = material
+        self.piece_square = piece_square
+        self.color_bb = [0, 0]
+        for piece in PIECE_TYPES:
+            self.color_bb[WHITE >> 3] |= self.piece_bb[WHITE|piece]
+            self.color_bb[BLACK >> 3] |= self.piece_bb[BLACK|piece]
+        self.occupied = self.color_bb[0] | self.color_bb[1]
+    
+    def __setitem__(self, index, piece):
+        if isinstance(index, slice):
+            bytearray.__setitem__(self, index, piece)
+            self.__init__(bytes(self))
+            return
+        if index < 0:
+            index += 64
+        old_piece = bytearray.__getitem__(self, index)
+        bytearray.__setitem__(self, index, piece)
+        
+        bit = 0b1 << index
+        self.piece_bb[old_piece] ^= bit
+        self.piece_bb[piece] ^= bit
+        if old_piece != EMPTY:
+            self.color_bb[old_piece >> 3] ^= bit
+        if piece != EMPTY:
+            self.color_bb[piece >> 3] ^= bit
+        self.occupied = ALL_SQUARES ^ self.piece_bb[EMPTY]
+        self.zobrist ^= ZOBRIST_PIECES[old_piece][index] ^ ZOBRIST_PIECES[piece][index]
+        self.pawn_zobrist ^= ZOBRIST_PAWNS[old_piece][index] ^ ZOBRIST_PAWNS[piece][index]
+        self.material += MATERIAL_SCORES[piece] - MATERIAL_SCORES[old_piece]
+        self.piece_square += PIECE_SQUARE_SCORES[piece][index] - PIECE_SQUARE_SCORES[old_piece][index]
+    
+    def copy(self):
+        new_board = Board.__new__(Board)
+        bytearray.extend(new_board, self)
+        new_board.piece_bb = self.piece_bb[:]
+        new_board.color_bb = self.color_bb[:]
+        new_board.occupied = self.occupied
+        new_board.zobrist = self.zobrist
+        new_board.pawn_zobrist = self.pawn_zobrist
+        new_board.material = self.material
+        new_board.piece_square = self.piece_square
+        return new_board
+    
+    def __copy__(self):
+        return self.copy()
+    
+    def __deepcopy__(self, memo):
+        return self.copy()
+    
+    def __reduce__(self):
+        return (Board, (bytes(self),))
+
+def as_board(board):
+    if isinstance(board, Board):
+        return board
+    return Board(board)
+
 class Game:
+    '''
+    Slotted so that servers can hold many games: the board is a Board bytearray, and the Zobrist
+    keys and undo records of the moves played are kept in arrays of 64-bit ints.
+    '''
+    __slots__ = ('board', 'to_move', 'ep_square', 'castling_rights', 'halfmove_clock', 'fullmove_number',
+                 'key_history', 'undo_stack', 'transposition_table', 'pawn_table', 'status_cache', 'FEN_cache')
+    
     def __init__(self, FEN=''):
-        self.board = INITIAL_BOARD
+        self.board = Board(INITIAL_BOARD)
         self.to_move = WHITE
         self.ep_square = 0
         self.castling_rights = FULL_CASTLING_RIGHTS
         self.halfmove_clock = 0
         self.fullmove_number = 1
         
-        self.position_history = []
         if FEN != '':
             self.load_FEN(FEN)
-            self.position_history.append(FEN)
         else:
-            self.position_history.append(INITIAL_FEN)
+            self.key_history = array('Q', [self.zobrist_key()])
             
-        self.move_history = []
+        self.undo_stack = array('Q')
+        self.transposition_table = None
+        self.pawn_table = None
+        self.status_cache = None
+        self.FEN_cache = None
     
-    def get_move_list(self):
-        return ' '.join(self.move_history)
+    def copy(self):
+        new_game = Game.__new__(Game)
+        for attribute in Game.__slots__:
+            setattr(new_game, attribute, getattr(self, attribute))
+        new_game.board = self.board.copy()
+        new_game.key_history = self.key_history[:]
+        new_game.undo_stack = self.undo_stack[:]
+        return new_game
     
-    def to_FEN(self):
-        FEN_str = ''
-        
-        for i in range(len(RANKS)):
-            first = len(self.board) - 8*(i+1)
-            empty_sqrs = 0
-            for fille in range(len(FILES)):
-                piece = self.board[first+fille]
-                if piece&PIECE_MASK == EMPTY:
-                    empty_sqrs += 1
-                else:
-                    if empty_sqrs > 0:
-                        FEN_str += '{}'.format(empty_sqrs)
-                    FEN_str += '{}'.format(piece2str(piece))
-                    empty_sqrs = 0
-            if empty_sqrs > 0:
-                FEN_str += '{}'.format(empty_sqrs)
-            FEN_str += '/'
-        FEN_str = FEN_str[:-1] + ' '
+    def zobrist_key(self):
+        '''
+        The en passant square only counts when a pawn of the side to move can capture onto it, as in
+        polyglot books, so move orders that transpose into one position share its key.
+        '''
+        board = self.board
+        key = board.zobrist ^ ZOBRIST_CASTLING[self.castling_rights]
+        if self.ep_square and PAWN_ATTACKS[opposing_color(self.to_move)][self.ep_square] & board.piece_bb[self.to_move|PAWN]:
+            key ^= ZOBRIST_EP[self.ep_square]
+        if self.to_move == BLACK:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
+    
+    def push(self, move):
+        '''
+        Plays move, packed or a pair of bitboards, on this game in place and pushes the undo record
+        (see the top of this file) that pop() needs to take it back. A move from an empty square or
+        onto its own square (such as False, which packs to a1a1) raises ValueError. Use push_null to pass.
+        '''
+        board = self.board
+        if not isinstance(move, int):
+            move = pack_move(move)
+        leaving_index = move & 0x3F
+        arriving_index = move >> 6 & 0x3F
+        leaving_position = SQUARE_BBS[leaving_index]
+        arriving_position = SQUARE_BBS[arriving_index]
+        moving_piece = board[leaving_index]
+        if moving_piece == EMPTY or leaving_index == arriving_index:
+            raise ValueError('not a move in this position: {}'.format(move2uci(move)))
+        captured_piece = board[arriving_index]
+        undo = moving_piece << UNDO_MOVING_SHIFT | captured_piece << UNDO_CAPTURED_SHIFT | \
+               self.castling_rights << UNDO_CASTLING_SHIFT | self.halfmove_clock << UNDO_HALFMOVE_SHIFT
+        if self.ep_square:
+            undo |= bb2index(self.ep_square) << UNDO_EP_SQUARE_SHIFT
         
-        if self.to_move == WHITE:
-            FEN_str += 'w '
+        # update_clocks
+        self.halfmove_clock += 1
         if self.to_move == BLACK:
-            FEN_str += 'b '
+            self.fullmove_number += 1
+        
+        # reset clock if capture
+        if captured_piece != EMPTY:
+            self.halfmove_clock = 0
+        
+        # for pawns: reset clock, removed captured ep, set new ep, promote
+        new_ep = 0
+        if moving_piece&PIECE_MASK == PAWN:
+            self.halfmove_clock = 0
             
-        if self.castling_rights & CASTLE_KINGSIDE_WHITE:
-            FEN_str += 'K'
-        if self.castling_rights & CASTLE_QUEENSIDE_WHITE:
-            FEN_str += 'Q'
-        if self.castling_rights & CASTLE_KINGSIDE_BLACK:
-            FEN_str += 'k'
-        if self.castling_rights & CASTLE_QUEENSIDE_BLACK:
-            FEN_str += 'q'
-        if self.castling_rights == 0:
-            FEN_str += '-'
-        FEN_str += ' '
+            if arriving_position == self.ep_square:
+                ep_index = ep_pawn_index(arriving_index)
+                undo |= UNDO_EP_CAPTURE | board[ep_index] << UNDO_EP_PIECE_SHIFT
+                board[ep_index] = EMPTY
             
-        if self.ep_square == 0:
-            FEN_str += '-'
-        else:
-            FEN_str += bb2str(self.ep_square)
+            if is_double_push(leaving_position, arriving_position):
+                new_ep = new_ep_square(leaving_position)
+            
+            if arriving_position&(RANK_1|RANK_8):
+                board[leaving_index] = self.to_move|QUEEN
+                move = move & 0xFFF | QUEEN << 12
+        self.ep_square = new_ep
         
-        FEN_str += ' {}'.format(self.halfmove_clock)
-        FEN_str += ' {}'.format(self.fullmove_number)
-        return FEN_str
-    
-    def load_FEN(self, FEN_str):
-        FEN_list = FEN_str.split(' ')
+        # update castling rights for rook moves and captures
+        self.castling_rights &= ~(CASTLING_RIGHTS_LOST.get(leaving_index, 0) | CASTLING_RIGHTS_LOST.get(arriving_index, 0))
         
-        board_str = FEN_list[0]
-        rank_list = board_str.split('/')
-        rank_list.reverse()
-        self.board = []
+        # castling
+        if moving_piece&PIECE_MASK == KING:
+            self.castling_rights &= ~KING_CASTLING_RIGHTS[moving_piece&COLOR_MASK]
+            castle_rook = CASTLE_ROOK_MOVES.get((moving_piece, leaving_index, arriving_index))
+            if castle_rook:
+                undo |= UNDO_CASTLE | board[castle_rook[0]] << UNDO_ROOK_SHIFT
+                board[castle_rook[1]] = board[castle_rook[0]]
+                board[castle_rook[0]] = EMPTY
         
-        for rank in rank_list:
-            rank_pieces = []
-            for p in rank:
-                if p.isdigit():
-                    for _ in range(int(p)):
-                        rank_pieces.append(EMPTY)
-                else:
-                    rank_pieces.append(str2piece(p))
-            self.board.extend(rank_pieces)
+        # update positions and next to move
+        board[arriving_index] = board[leaving_index]
+        board[leaving_index] = EMPTY
+        self.to_move = opposing_color(self.to_move)
         
-        to_move_str = FEN_list[1].lower()
-        if to_move_str == 'w':
-            self.to_move = WHITE
-        if to_move_str == 'b':
-            self.to_move = BLACK
+        # update history
+        self.undo_stack.append(undo | move)
+        self.key_history.append(self.zobrist_key())
+    
+    def push_null(self):
+        '''
+        Passes the turn, for null-move pruning. pop() takes it back like any move. The halfmove clock
+        restarts, so no repetition or 50-move draw is counted across the pass.
+        '''
+        board = self.board
+        undo = NULL_MOVE | board[0] << UNDO_MOVING_SHIFT | board[0] << UNDO_CAPTURED_SHIFT | \
+               self.castling_rights << UNDO_CASTLING_SHIFT | self.halfmove_clock << UNDO_HALFMOVE_SHIFT
+        if self.ep_square:
+            undo |= bb2index(self.ep_square) << UNDO_EP_SQUARE_SHIFT
         
-        castling_rights_str = FEN_list[2]
-        self.castling_rights = 0
-        if castling_rights_str.find('K') >= 0:
-            self.castling_rights |= CASTLE_KINGSIDE_WHITE
-        if castling_rights_str.find('Q') >= 0:
-            self.castling_rights |= CASTLE_QUEENSIDE_WHITE
-        if castling_rights_str.find('k') >= 0:
-            self.castling_rights |= CASTLE_KINGSIDE_BLACK
-        if castling_rights_str.find('q') >= 0:
-            self.castling_rights |= CASTLE_QUEENSIDE_BLACK 
+        self.halfmove_clock = 0
+        if self.to_move == BLACK:
+            self.fullmove_number += 1
+        self.ep_square = 0
+        self.to_move = opposing_color(self.to_move)
         
-        ep_str = FEN_list[3]
-        if ep_str == '-':
-            self.ep_square = 0
-        else:
-            self.ep_square = str2bb(ep_str)
+        self.undo_stack.append(undo)
+        self.key_history.append(self.zobrist_key())
+    
+    def pop(self):
+        undo = self.undo_stack.pop()
+        move = undo & 0x7FFF
+        moving_piece = undo >> UNDO_MOVING_SHIFT & 0xF
+        ep_index = undo >> UNDO_EP_SQUARE_SHIFT & 0x3F
+        self.castling_rights = undo >> UNDO_CASTLING_SHIFT & 0xF
+        self.ep_square = SQUARE_BBS[ep_index] if ep_index else 0
+        self.halfmove_clock = undo >> UNDO_HALFMOVE_SHIFT
+        board = self.board
+        
+        self.to_move = opposing_color(self.to_move)
+        if self.to_move == BLACK:
+            self.fullmove_number -= 1
+        
+        board[move >> 6 & 0x3F] = undo >> UNDO_CAPTURED_SHIFT & 0xF
+        board[move & 0x3F] = moving_piece
+        if undo & UNDO_EP_CAPTURE:
+            board[ep_pawn_index(ep_index)] = undo >> UNDO_EP_PIECE_SHIFT & 0xF
+        if undo & UNDO_CASTLE:
+            castle_rook = CASTLE_ROOK_MOVES[(moving_piece, move & 0x3F, move >> 6 & 0x3F)]
+            board[castle_rook[0]] = undo >> UNDO_ROOK_SHIFT & 0xF
+            board[castle_rook[1]] = EMPTY
         
-        self.halfmove_clock = int(FEN_list[4])
-        self.fullmove_number = int(FEN_list[5])
+        self.key_history.pop()
+        return move
+    
+    @property
+    def move_history(self):
+        '''Packed moves played, taken from the undo records.'''
+        return array('H', [ undo & 0x7FFF for undo in self.undo_stack ])
+    
+    @property
+    def position_history(self):
+        '''FEN of every position since the game was set up, rebuilt from the undo stack on request.'''
+        game = self.copy()
+        history = [game.to_FEN()]
+        for _ in range(len(self.key_history)-1):
+            game.pop()
+            history.append(game.to_FEN())
+        history.reverse()
+        return history
+    
+    def get_move_list(self):
+        return ' '.join(move2uci(move) for move in self.move_history)
+    
+    def to_FEN(self):
+        '''Kept on the game until its position or clocks change, as servers and clients ask for it repeatedly.'''
+        position = (self.zobrist_key(), self.ep_square, self.halfmove_clock, self.fullmove_number)
+        if self.FEN_cache is None or self.FEN_cache[0] != position:
+            FEN_str = ' '.join([ board2FEN(self.board),
+                                 FEN_TO_MOVE[self.to_move],
+                                 FEN_CASTLING[self.castling_rights],
+                                 SQUARE_NAMES[bb2index(self.ep_square)] if self.ep_square else '-',
+                                 str(self.halfmove_clock),
+                                 str(self.fullmove_number) ])
+            self.FEN_cache = (position, FEN_str)
+        return self.FEN_cache[1]
+    
+    def load_FEN(self, FEN_str):
+        '''Raises ValueError naming FEN_str when any of its six fields cannot be read.'''
+        FEN_list = FEN_str.split(' ')
+        try:
+            self.board = FEN2board(FEN_list[0])
+            if len(self.board) != 64:
+                raise ValueError('the placement has {} squares'.format(len(self.board)))
+            self.to_move = FEN_TO_MOVE[FEN_list[1].lower()]
+            
+            self.castling_rights = 0
+            for flag in FEN_list[2]:
+                self.castling_rights |= FEN_CASTLING_FLAGS.get(flag, 0)
+            
+            self.ep_square = 0 if FEN_list[3] == '-' else str2bb(FEN_list[3])
+            self.halfmove_clock = int(FEN_list[4])
+            self.fullmove_number = int(FEN_list[5])
+        except (KeyError, IndexError, ValueError) as error:
+            raise ValueError('invalid FEN {!r}: {}'.format(FEN_str, error)) from error
+        self.key_history = array('Q', [self.zobrist_key()])
+
+class TranspositionTable:
+    '''
+    Fixed-size table of search results indexed by Zobrist key, keeping the deeper entry on collisions:
+    entry = (key, depth, score, bound, best_move)
+    '''
+    def __init__(self, size=TT_SIZE):
+        self.size = size
+        self.entries = [None]*size
+        self.hits = 0
+        self.misses = 0
+    
+    def probe(self, key):
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+    
+    def store(self, key, depth, score, bound, best_move):
+        index = key % self.size
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or entry[1] <= depth:
+            self.entries[index] = (key, depth, score, bound, best_move)
+    
+    def clear(self):
+        self.entries = [None]*self.size
+        self.hits = 0
+        self.misses = 0
+
+def get_transposition_table(game):
+    if game.transposition_table is None:
+        game.transposition_table = TranspositionTable()
+    return game.transposition_table
+
+class PawnTable:
+    '''
+    Fixed-size cache of pawn structure evaluations indexed by the pawn-only Zobrist key:
+    entry = (key, score, open_files, semi_open_files)
+    '''
+    def __init__(self, size=PAWN_TABLE_SIZE):
+        self.size = size
+        self.entries = [None]*size
+        self.hits = 0
+        self.misses = 0
+    
+    def probe(self, key):
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+    
+    def store(self, key, score, open_files, semi_open_files):
+        self.entries[key % self.size] = (key, score, open_files, semi_open_files)
+
+def get_pawn_table(game):
+    if game.pawn_table is None:
+        game.pawn_table = PawnTable()
+    return game.pawn_table
 
 # ================================
 
@@ -286,9 +655,8 @@ def get_piece(board, bitboard):
     return board[bb2index(bitboard)]
         
 def bb2index(bitboard):
-    for i in range(64):
-        if bitboard & (0b1 << i):
-            return i
+    if bitboard:
+        return (bitboard & -bitboard).bit_length() - 1
 
 def str2index(position_str):
     fille = FILES.index(position_str[0].lower())
@@ -308,11 +676,46 @@ def str2bb(position_str):
 def move2str(move):
     return bb2str(move[0]) + bb2str(move[1])
 
+def pack_move(move, promotion=EMPTY):
+    return bb2index(move[0]) | bb2index(move[1]) << 6 | promotion << 12
+
+def unpack_move(packed_move):
+    return (SQUARE_BBS[packed_move & 0x3F], SQUARE_BBS[packed_move >> 6 & 0x3F])
+
+def move2uci(packed_move):
+    uci = SQUARE_NAMES[packed_move & 0x3F] + SQUARE_NAMES[packed_move >> 6 & 0x3F]
+    if packed_move >> 12:
+        uci += PIECE_CODES[BLACK|packed_move >> 12]
+    return uci
+
+def uci2move(uci):
+    promotion = PIECE_CODES[uci[4].lower()]&PIECE_MASK if len(uci) > 4 else EMPTY
+    return str2index(uci[:2]) | str2index(uci[2:4]) << 6 | promotion << 12
+
+SQUARE_BBS = [ 0b1 << i for i in range(64) ]
+SQUARE_NAMES = [ bb2str(square) for square in SQUARE_BBS ]
+
+def board2FEN(board):
+    '''Piece placement field of a FEN: the ranks from 8 down to 1, runs of empty squares as digits.'''
+    placement = '/'.join([ ''.join([ FEN_PIECES[piece] for piece in board[first:first+8] ]) for first in range(56, -8, -8) ])
+    for (run, length) in FEN_EMPTY_RUNS:
+        placement = placement.replace(run, length)
+    return placement
+
+def FEN2squares(placement):
+    '''Squares a1 to h8 of a FEN piece placement field.'''
+    ranks = placement.translate(FEN_EXPAND_EMPTY).split('/')
+    ranks.reverse()
+    return [ PIECE_CODES[piece] for piece in ''.join(ranks) ]
+
+def FEN2board(placement):
+    return Board(FEN2squares(placement))
+
 def single_gen(bitboard):
-    for i in range(64):
-        bit = 0b1 << i
-        if bitboard & bit:
-            yield bit
+    while bitboard:
+        bit = bitboard & -bitboard
+        yield bit
+        bitboard ^= bit
 
 def piece_gen(board, piece_code):
     for i in range(64):
@@ -370,25 +773,21 @@ def print_bitboard(bitboard):
     print('  a b c d e f g h')
     
 def lsb(bitboard):
-    for i in range(64):
-        bit = (0b1 << i) 
-        if bit & bitboard:
-            return bit
+    if bitboard:
+        return bitboard & -bitboard
 
 def msb(bitboard):
-    for i in range(64):
-        bit = (0b1 << (63-i)) 
-        if bit & bitboard:
-            return bit
+    if bitboard:
+        return 0b1 << (bitboard.bit_length() - 1)
 
 def get_colored_pieces(board, color):
-    return list2int([ (i != EMPTY and i&COLOR_MASK == color) for i in board ])
+    return as_board(board).color_bb[color >> 3]
 
 def empty_squares(board):
-    return list2int([ i == EMPTY for i in board ])
+    return as_board(board).piece_bb[EMPTY]
 
 def occupied_squares(board):
-    return nnot(empty_squares(board))
+    return as_board(board).occupied
 
 def list2int(lst):
     rev_list = lst[:]
@@ -399,9 +798,7 @@ def nnot(bitboard):
     return ~bitboard & ALL_SQUARES
 
 def rotate_board(board):
-    rotated_board = deepcopy(board)
-    rotated_board.reverse()
-    return rotated_board
+    return Board(board[::-1])
 
 def flip_board_v(board):
     flip = [56,  57,  58,  59,  60,  61,  62,  63,
@@ -413,7 +810,7 @@ def flip_board_v(board):
              8,   9,  10,  11,  12,  13,  14,  15,
              0,   1,   2,   3,   4,   5,   6,   7]
     
-    return deepcopy([board[flip[i]] for i in range(64)])
+    return Board([board[flip[i]] for i in range(64)])
 
 def east_one(bitboard):
     return (bitboard << 1) & nnot(FILE_A)
@@ -446,84 +843,19 @@ def move_piece(board, move):
     return new_board
 
 def make_move(game, move):
-    new_game = deepcopy(game)
-    leaving_position = move[0]
-    arriving_position = move[1]
-    
-    # update_clocks
-    new_game.halfmove_clock += 1
-    if new_game.to_move == BLACK:
-        new_game.fullmove_number += 1
-    
-    # reset clock if capture
-    if get_piece(new_game.board, arriving_position) != EMPTY:
-        new_game.halfmove_clock = 0
-    
-    # for pawns: reset clock, removed captured ep, set new ep, promote
-    if get_piece(new_game.board, leaving_position)&PIECE_MASK == PAWN:
-        new_game.halfmove_clock = 0
-        
-        if arriving_position == game.ep_square:
-            new_game.board = remove_captured_ep(new_game)
-    
-        if is_double_push(leaving_position, arriving_position):
-            new_game.ep_square = new_ep_square(leaving_position)
-            
-        if arriving_position&(RANK_1|RANK_8):
-            new_game.board[bb2index(leaving_position)] = new_game.to_move|QUEEN
-    
-    # reset ep square if not updated
-    if new_game.ep_square == game.ep_square:
-        new_game.ep_square = 0
-        
-    # update castling rights for rook moves
-    if leaving_position == str2bb('a1'):
-        new_game.castling_rights = remove_castling_rights(new_game, CASTLE_QUEENSIDE_WHITE)
-    if leaving_position == str2bb('h1'):
-        new_game.castling_rights = remove_castling_rights(new_game, CASTLE_KINGSIDE_WHITE)
-    if leaving_position == str2bb('a8'):
-        new_game.castling_rights = remove_castling_rights(new_game, CASTLE_QUEENSIDE_BLACK)
-    if leaving_position == str2bb('h8'):
-        new_game.castling_rights = remove_castling_rights(new_game, CASTLE_KINGSIDE_BLACK)
-    
-    # castling
-    if get_piece(new_game.board, leaving_position) == WHITE|KING:
-        new_game.castling_rights = remove_castling_rights(new_game, CASTLE_KINGSIDE_WHITE|CASTLE_QUEENSIDE_WHITE)
-        if leaving_position == str2bb('e1'):
-            if arriving_position == str2bb('g1'):
-                new_game.board = move_piece(new_game.board, [str2bb('h1'), str2bb('f1')])
-            if arriving_position == str2bb('c1'):
-                new_game.board = move_piece(new_game.board, [str2bb('a1'), str2bb('d1')])
-        
-    if get_piece(new_game.board, leaving_position) == BLACK|KING:
-        new_game.castling_rights = remove_castling_rights(new_game, CASTLE_KINGSIDE_BLACK|CASTLE_QUEENSIDE_BLACK)
-        if leaving_position == str2bb('e8'):
-            if arriving_position == str2bb('g8'):
-                new_game.board = move_piece(new_game.board, [str2bb('h8'), str2bb('f8')])
-            if arriving_position == str2bb('c8'):
-                new_game.board = move_piece(new_game.board, [str2bb('a8'), str2bb('d8')])
-    
-    # update positions and next to move
-    new_game.board = move_piece(new_game.board, (leaving_position, arriving_position))
-    new_game.to_move = opposing_color(new_game.to_move)
-    
-    # update history
-    new_game.move_history.append(move2str(move))
-    new_game.position_history.append(new_game.to_FEN())
+    new_game = game.copy()
+    new_game.push(move)
     return new_game
 
 def unmake_move(game):
-    if len(game.position_history) < 2:
-        return deepcopy(game)
-    
-    new_game = Game(game.position_history[-2])
-    new_game.move_history = deepcopy(game.move_history)[:-1]
-    new_game.position_history = deepcopy(game.position_history)[:-1]
+    new_game = game.copy()
+    if len(game.key_history) > 1:
+        new_game.pop()
     return new_game
 
 def get_rank(rank_num):
     rank_num = int(rank_num)
-    return RANK_MASKS[rank_num]
+    return RANK_MASKS[rank_num-1]
      
 def get_file(file_str):
     file_str = file_str.lower()
@@ -539,10 +871,11 @@ def get_filter(filter_str):
 # ========== PAWN ==========
 
 def get_all_pawns(board):
-    return list2int([ i&PIECE_MASK == PAWN for i in board ])
+    board = as_board(board)
+    return board.piece_bb[WHITE|PAWN] | board.piece_bb[BLACK|PAWN]
 
 def get_pawns(board, color):
-    return list2int([ i == color|PAWN for i in board ])
+    return as_board(board).piece_bb[color|PAWN]
 
 def pawn_moves(moving_piece, game, color):
     return pawn_pushes(moving_piece, game.board, color) | pawn_captures(moving_piece, game, color)
@@ -564,7 +897,17 @@ def pawn_ep_captures(attacking_piece, game, color):
     return pawn_attacks(attacking_piece, game.board, color) & ep_squares
 
 def pawn_attacks(attacking_piece, board, color):
-    return pawn_east_attacks(attacking_piece, board, color) | pawn_west_attacks(attacking_piece, board, color)
+    pawns = attacking_piece & get_colored_pieces(board, color)
+    atks = PAWN_ATTACKS[color].get(pawns)
+    if atks is None:
+        return pawn_shift_attacks(pawns, color)
+    return atks
+
+def pawn_shift_attacks(pawns, color):
+    if color == WHITE:
+        return NE_one(pawns) | NW_one(pawns)
+    if color == BLACK:
+        return SE_one(pawns) | SW_one(pawns)
 
 def pawn_simple_pushes(moving_piece, board, color):
     if color == WHITE:
@@ -603,6 +946,19 @@ def new_ep_square(leaving_square):
     if leaving_square&RANK_7:
         return south_one(leaving_square)
 
+def ep_pawn_index(ep_index):
+    '''Index of the pawn that can be taken en passant on the square at ep_index (on the third or sixth rank).'''
+    return ep_index + 8 if ep_index < 32 else ep_index - 8
+
+# single-square pawn attacks by color, precomputed at import
+PAWN_ATTACKS = { color: { 0b1 << i: pawn_shift_attacks(0b1 << i, color) for i in range(64) } for color in [WHITE, BLACK] }
+PAWN_ATTACKS[WHITE][0] = PAWN_ATTACKS[BLACK][0] = 0
+
+# pawn structure masks by file and rank
+ADJACENT_FILES = [ (FILE_MASKS[f-1] if f > 0 else 0) | (FILE_MASKS[f+1] if f < 7 else 0) for f in range(8) ]
+RANKS_AHEAD = { WHITE: [ sum(RANK_MASKS[rank+1:]) for rank in range(8) ],
+                BLACK: [ sum(RANK_MASKS[:rank]) for rank in range(8) ] }
+
 def remove_captured_ep(game):
     new_board = deepcopy(game.board)
     if game.ep_square & RANK_3:
@@ -614,12 +970,18 @@ def remove_captured_ep(game):
 # ========== KNIGHT ==========
 
 def get_knights(board, color):
-    return list2int([ i == color|KNIGHT for i in board ])
+    return as_board(board).piece_bb[color|KNIGHT]
 
 def knight_moves(moving_piece, board, color):
     return knight_attacks(moving_piece) & nnot(get_colored_pieces(board, color))
 
 def knight_attacks(moving_piece):
+    atks = KNIGHT_ATTACKS.get(moving_piece)
+    if atks is None:
+        return knight_shift_attacks(moving_piece)
+    return atks
+
+def knight_shift_attacks(moving_piece):
     return knight_NNE(moving_piece) | \
            knight_ENE(moving_piece) | \
            knight_NNW(moving_piece) | \
@@ -653,6 +1015,10 @@ def knight_SSE(moving_piece):
 def knight_SSW(moving_piece):
     return moving_piece >> 17 & nnot(FILE_H)
 
+# single-square knight attacks, precomputed at import
+KNIGHT_ATTACKS = { 0b1 << i: knight_shift_attacks(0b1 << i) for i in range(64) }
+KNIGHT_ATTACKS[0] = 0
+
 def knight_fill(moving_piece, n):
     fill = moving_piece
     for _ in range(n):
@@ -672,16 +1038,26 @@ def knight_distance(pos1, pos2):
 # ========== KING ==========
 
 def get_king(board, color):
-    return list2int([ i == color|KING for i in board ])
+    return as_board(board).piece_bb[color|KING]
 
 def king_moves(moving_piece, board, color):
     return king_attacks(moving_piece) & nnot(get_colored_pieces(board, color))
 
 def king_attacks(moving_piece):
+    atks = KING_ATTACKS.get(moving_piece)
+    if atks is None:
+        return king_shift_attacks(moving_piece)
+    return atks
+
+def king_shift_attacks(moving_piece):
     king_atks = moving_piece | east_one(moving_piece) | west_one(moving_piece)
     king_atks |= north_one(king_atks) | south_one(king_atks)
     return king_atks & nnot(moving_piece)
 
+# single-square king attacks, precomputed at import
+KING_ATTACKS = { 0b1 << i: king_shift_attacks(0b1 << i) for i in range(64) }
+KING_ATTACKS[0] = 0
+
 def can_castle_kingside(game, color):
     if color == WHITE:
         return (game.castling_rights & CASTLE_KINGSIDE_WHITE) and \
@@ -734,7 +1110,7 @@ def remove_castling_rights(game, removed_rights):
 # ========== BISHOP ==========
 
 def get_bishops(board, color):
-    return list2int([ i == color|BISHOP for i in board ])
+    return as_board(board).piece_bb[color|BISHOP]
 
 def bishop_rays(moving_piece):
     return diagonal_rays(moving_piece) | anti_diagonal_rays(moving_piece)
@@ -804,6 +1180,11 @@ def anti_diagonal_attacks(single_piece, board, color):
     return NW_attacks(single_piece, board, color) | SE_attacks(single_piece, board, color)
 
 def bishop_attacks(moving_piece, board, color):
+    if sliding_attacks_from_tables:
+        return bishop_table_attacks(moving_piece, occupied_squares(board))
+    return bishop_ray_attacks(moving_piece, board, color)
+
+def bishop_ray_attacks(moving_piece, board, color):
     atks = 0
     for piece in single_gen(moving_piece):
         atks |= diagonal_attacks(piece, board, color) | anti_diagonal_attacks(piece, board, color)
@@ -815,7 +1196,7 @@ def bishop_moves(moving_piece, board, color):
 # ========== ROOK ==========
 
 def get_rooks(board, color):
-    return list2int([ i == color|ROOK for i in board ])
+    return as_board(board).piece_bb[color|ROOK]
 
 def rook_rays(moving_piece):
     return rank_rays(moving_piece) | file_rays(moving_piece)
@@ -885,6 +1266,11 @@ def file_attacks(single_piece, board, color):
     return north_attacks(single_piece, board, color) | south_attacks(single_piece, board, color)
 
 def rook_attacks(moving_piece, board, color):
+    if sliding_attacks_from_tables:
+        return rook_table_attacks(moving_piece, occupied_squares(board))
+    return rook_ray_attacks(moving_piece, board, color)
+
+def rook_ray_attacks(moving_piece, board, color):
     atks = 0
     for single_piece in single_gen(moving_piece):
         atks |= rank_attacks(single_piece, board, color) | file_attacks(single_piece, board, color)
@@ -896,7 +1282,7 @@ def rook_moves(moving_piece, board, color):
 # ========== QUEEN ==========
 
 def get_queen(board, color):
-    return list2int([ i == color|QUEEN for i in board ])
+    return as_board(board).piece_bb[color|QUEEN]
 
 def queen_rays(moving_piece):
     return rook_rays(moving_piece) | bishop_rays(moving_piece)
@@ -918,10 +1304,88 @@ def joker_attacks(moving_piece, board, color):
 def joker_moves(moving_piece, board, color):
     return queen_moves(moving_piece, board, color) | knight_moves(moving_piece, board, color)
 
+# ========== SLIDING ATTACK TABLES ==========
+# For every square and each line through it (rank, file, diagonal, anti-diagonal) the attacks along
+# that line are precomputed for every occupancy of the line's inner squares (the edge square
+# never blocks anything), so a slider needs one dict lookup per line instead of walking rays.
+
+def slide(single_piece, occupied, step):
+    atks = 0
+    square = step(single_piece)
+    while square:
+        atks |= square
+        if square & occupied:
+            break
+        square = step(square)
+    return atks
+
+def line_tables(steps):
+    masks = {}
+    tables = {}
+    for i in range(64):
+        square = 0b1 << i
+        mask = 0
+        for step in steps:
+            ray = slide(square, 0, step)
+            if ray:
+                edge = msb(ray) if ray > square else lsb(ray)
+                mask |= ray ^ edge
+        masks[square] = mask
+        
+        tables[square] = {}
+        occupancy = 0
+        while True:
+            tables[square][occupancy] = slide(square, occupancy, steps[0]) | slide(square, occupancy, steps[1])
+            occupancy = (occupancy - mask) & mask
+            if occupancy == 0:
+                break
+    return masks, tables
+
+RANK_LINE_MASKS, RANK_LINE_ATTACKS = line_tables([east_one, west_one])
+FILE_LINE_MASKS, FILE_LINE_ATTACKS = line_tables([north_one, south_one])
+DIAGONAL_LINE_MASKS, DIAGONAL_LINE_ATTACKS = line_tables([NE_one, SW_one])
+ANTI_DIAGONAL_LINE_MASKS, ANTI_DIAGONAL_LINE_ATTACKS = line_tables([NW_one, SE_one])
+
+def bishop_table_attacks(moving_piece, occupied):
+    atks = 0
+    for piece in single_gen(moving_piece):
+        atks |= DIAGONAL_LINE_ATTACKS[piece][occupied & DIAGONAL_LINE_MASKS[piece]] | \
+                ANTI_DIAGONAL_LINE_ATTACKS[piece][occupied & ANTI_DIAGONAL_LINE_MASKS[piece]]
+    return atks
+
+def rook_table_attacks(moving_piece, occupied):
+    atks = 0
+    for piece in single_gen(moving_piece):
+        atks |= RANK_LINE_ATTACKS[piece][occupied & RANK_LINE_MASKS[piece]] | \
+                FILE_LINE_ATTACKS[piece][occupied & FILE_LINE_MASKS[piece]]
+    return atks
+
 # ===========================
 
 def is_attacked(target, board, attacking_color):
-    return count_attacks(target, board, attacking_color) > 0
+    # casts each piece's attacks outward from the target and intersects them with the attacking pieces
+    board = as_board(board)
+    pieces = board.piece_bb
+    for square in single_gen(target):
+        if PAWN_ATTACKS[opposing_color(attacking_color)][square] & pieces[attacking_color|PAWN] or \
+           KNIGHT_ATTACKS[square] & (pieces[attacking_color|KNIGHT] | pieces[attacking_color|JOKER]) or \
+           KING_ATTACKS[square] & pieces[attacking_color|KING] or \
+           bishop_attacks(square, board, attacking_color) & (pieces[attacking_color|BISHOP] | pieces[attacking_color|QUEEN] | pieces[attacking_color|JOKER]) or \
+           rook_attacks(square, board, attacking_color) & (pieces[attacking_color|ROOK] | pieces[attacking_color|QUEEN] | pieces[attacking_color|JOKER]):
+            return True
+    return False
+
+def get_attackers(target, board, attacking_color):
+    board = as_board(board)
+    pieces = board.piece_bb
+    attackers = 0
+    for square in single_gen(target):
+        attackers |= PAWN_ATTACKS[opposing_color(attacking_color)][square] & pieces[attacking_color|PAWN]
+        attackers |= KNIGHT_ATTACKS[square] & (pieces[attacking_color|KNIGHT] | pieces[attacking_color|JOKER])
+        attackers |= KING_ATTACKS[square] & pieces[attacking_color|KING]
+        attackers |= bishop_attacks(square, board, attacking_color) & (pieces[attacking_color|BISHOP] | pieces[attacking_color|QUEEN] | pieces[attacking_color|JOKER])
+        attackers |= rook_attacks(square, board, attacking_color) & (pieces[attacking_color|ROOK] | pieces[attacking_color|QUEEN] | pieces[attacking_color|JOKER])
+    return attackers
 
 def is_check(board, color):
     return is_attacked(get_king(board, color), board, opposing_color(color))
@@ -964,14 +1428,11 @@ def get_moves(moving_piece, game, color):
 
 def count_attacks(target, board, attacking_color):
     attack_count = 0
+    board = as_board(board)
       
-    for index in range(64):
-        piece = board[index]
-        if piece != EMPTY and piece&COLOR_MASK == attacking_color:
-            pos = 0b1 << index
-            
-            if get_attacks(pos, board, attacking_color) & target:
-                attack_count += 1
+    for pos in single_gen(get_colored_pieces(board, attacking_color)):
+        if get_attacks(pos, board, attacking_color) & target:
+            attack_count += 1
                       
     return attack_count
 
@@ -983,7 +1444,7 @@ def material_sum(board, color):
     return material
 
 def material_balance(board):
-    return material_sum(board, WHITE) - material_sum(board, BLACK)
+    return as_board(board).material
 
 def mobility_balance(game):
     return count_legal_moves(game, WHITE) - count_legal_moves(game, BLACK)
@@ -1003,7 +1464,84 @@ def evaluate_end_node(game):
         return 0
 
 def positional_balance(game):
-    return positional_bonus(game, WHITE) - positional_bonus(game, BLACK) 
+    '''
+    Same score as positional_bonus(game, WHITE) - positional_bonus(game, BLACK), from the
+    board's running piece-square total and the king and rook bitboards, plus the pawn structure.
+    '''
+    board = game.board
+    [pawn_score, open_files, semi_open_files] = get_pawn_structure(game)
+    balance = board.piece_square + pawn_score
+    
+    king_bonus = KING_ENDGAME_BONUS if is_endgame(board) else KING_BONUS
+    for king in single_gen(board.piece_bb[WHITE|KING]):
+        balance += king_bonus[bb2index(king)]
+    for king in single_gen(board.piece_bb[BLACK|KING]):
+        balance -= king_bonus[bb2index(king) ^ 56]
+    
+    for color, sign, seventh_rank in [(WHITE, 1, RANK_7), (BLACK, -1, RANK_2)]:
+        for rook in single_gen(board.piece_bb[color|ROOK]):
+            if rook & open_files:
+                balance += sign*ROOK_OPEN_FILE_BONUS
+            elif rook & semi_open_files:
+                balance += sign*ROOK_SEMI_OPEN_FILE_BONUS
+            if rook & seventh_rank:
+                balance += sign*ROOK_ON_SEVENTH_BONUS
+    
+    return balance
+
+def get_pawn_structure(game):
+    key = game.board.pawn_zobrist
+    table = get_pawn_table(game)
+    entry = table.probe(key)
+    if entry is None:
+        entry = (key,) + tuple(pawn_structure(game.board))
+        table.store(*entry)
+    return entry[1:]
+
+def pawn_structure(board):
+    '''
+    Scores doubled, isolated, backward and passed pawns, white minus black, and finds the files
+    with no pawn (open) and with a single pawn (semi-open): [score, open_files, semi_open_files]
+    '''
+    white_pawns = board.piece_bb[WHITE|PAWN]
+    black_pawns = board.piece_bb[BLACK|PAWN]
+    score = pawn_structure_bonus(white_pawns, black_pawns, WHITE) - \
+            pawn_structure_bonus(black_pawns, white_pawns, BLACK)
+    
+    open_files = 0
+    semi_open_files = 0
+    for file_mask in FILE_MASKS:
+        file_pawns = count_pieces((white_pawns | black_pawns) & file_mask)
+        if file_pawns == 0:
+            open_files |= file_mask
+        elif file_pawns == 1:
+            semi_open_files |= file_mask
+    return [score, open_files, semi_open_files]
+
+def pawn_structure_bonus(pawns, enemy_pawns, color):
+    bonus = 0
+    for file_mask in FILE_MASKS:
+        file_pawns = count_pieces(pawns & file_mask)
+        if file_pawns > 1:
+            bonus -= DOUBLED_PAWN_PENALTY*(file_pawns - 1)
+    
+    enemy_attacks = pawn_shift_attacks(enemy_pawns, opposing_color(color))
+    for pawn in single_gen(pawns):
+        index = bb2index(pawn)
+        pawn_file = index & 7
+        ahead = RANKS_AHEAD[color][index >> 3]
+        
+        if not enemy_pawns & (FILE_MASKS[pawn_file] | ADJACENT_FILES[pawn_file]) & ahead:
+            bonus += PASSED_PAWN_BONUS
+        
+        if not pawns & ADJACENT_FILES[pawn_file]:
+            bonus -= ISOLATED_PAWN_PENALTY
+        elif not pawns & ADJACENT_FILES[pawn_file] & ~ahead:
+            # no pawn beside or behind can defend it, and an enemy pawn guards the square in front
+            stop_square = north_one(pawn) if color == WHITE else south_one(pawn)
+            if stop_square & enemy_attacks:
+                bonus -= BACKWARDS_PAWN_PENALTY
+    return bonus
 
 def positional_bonus(game, color):
     bonus = 0
@@ -1063,6 +1601,118 @@ def is_semi_open_file(bitboard, board):
 def count_pieces(bitboard):
     return bin(bitboard).count("1")
 
+# ========== VECTORIZED EVALUATION ==========
+# Scores many boards at once with NumPy, for offline analysis of large position sets. Boards are
+# packed into an (N, 64) int8 array of piece codes; pawns and rooks are then turned into arrays of
+# N uint64 bitboards, so the pawn structure and rook files come from the same fills and shifts as
+# on a single board.
+
+if np is not None:
+    # [endgame][piece][index]: material, piece-square and king bonus of a piece on a square, white minus black
+    VECTOR_SQUARE_SCORES = np.array([ [ [ MATERIAL_SCORES[piece] + PIECE_SQUARE_SCORES[piece][index] +
+                                          (king_bonus[index] if piece == WHITE|KING else
+                                           -king_bonus[index ^ 56] if piece == BLACK|KING else 0)
+                                          for index in range(64) ] for piece in range(16) ]
+                                      for king_bonus in (KING_BONUS, KING_ENDGAME_BONUS) ], dtype=np.int64)
+    VECTOR_SQUARES = np.arange(64)
+    VECTOR_NOT_FILE_A = np.uint64(ALL_SQUARES ^ FILE_A)
+    VECTOR_NOT_FILE_H = np.uint64(ALL_SQUARES ^ FILE_H)
+    VECTOR_RANK_1 = np.uint64(RANK_1)
+    VECTOR_RANK_2 = np.uint64(RANK_2)
+    VECTOR_RANK_7 = np.uint64(RANK_7)
+    VECTOR_SHIFTS = { shift: np.uint64(shift) for shift in (1, 2, 4, 8, 16, 32, 56) }
+    VECTOR_POPCOUNT_MASKS = [ np.uint64(mask) for mask in (0x5555555555555555, 0x3333333333333333,
+                                                           0x0F0F0F0F0F0F0F0F, 0x0101010101010101) ]
+
+def require_numpy():
+    if np is None:
+        raise ImportError('NumPy is required for vectorized evaluation')
+
+def pack_boards(boards):
+    '''Stacks boards (or any 64-square lists) into a read-only (N, 64) int8 array.'''
+    require_numpy()
+    return np.frombuffer(b''.join(bytes(board) for board in boards), dtype=np.int8).reshape(-1, 64)
+
+def vector_bitboards(squares):
+    '''(N, 64) bool array -> N uint64 bitboards.'''
+    require_numpy()
+    return np.packbits(squares, axis=1, bitorder='little').view('<u8').ravel()
+
+def vector_count(bitboards):
+    '''count_pieces of every bitboard in an array.'''
+    require_numpy()
+    [m1, m2, m4, h01] = VECTOR_POPCOUNT_MASKS
+    bitboards = bitboards - ((bitboards >> VECTOR_SHIFTS[1]) & m1)
+    bitboards = (bitboards & m2) + ((bitboards >> VECTOR_SHIFTS[2]) & m2)
+    bitboards = (bitboards + (bitboards >> VECTOR_SHIFTS[4])) & m4
+    return ((bitboards * h01) >> VECTOR_SHIFTS[56]).astype(np.int64)
+
+def vector_north_fill(bitboards):
+    require_numpy()
+    for shift in (8, 16, 32):
+        bitboards = bitboards | (bitboards << VECTOR_SHIFTS[shift])
+    return bitboards
+
+def vector_south_fill(bitboards):
+    require_numpy()
+    for shift in (8, 16, 32):
+        bitboards = bitboards | (bitboards >> VECTOR_SHIFTS[shift])
+    return bitboards
+
+def vector_file_fill(bitboards):
+    return vector_north_fill(bitboards) | vector_south_fill(bitboards)
+
+def vector_sides(bitboards):
+    '''Squares beside each bit, east and west.'''
+    require_numpy()
+    return ((bitboards << VECTOR_SHIFTS[1]) & VECTOR_NOT_FILE_A) | ((bitboards >> VECTOR_SHIFTS[1]) & VECTOR_NOT_FILE_H)
+
+def vector_pawn_bonus(pawns, enemy_pawns):
+    '''pawn_structure_bonus over arrays of bitboards, seen from white (black pawns are passed in flipped).'''
+    bonus = -DOUBLED_PAWN_PENALTY*(vector_count(pawns) - vector_count(vector_file_fill(pawns) & VECTOR_RANK_1))
+    
+    enemy_front = vector_south_fill(enemy_pawns | vector_sides(enemy_pawns)) >> VECTOR_SHIFTS[8]
+    bonus += PASSED_PAWN_BONUS*vector_count(pawns & ~enemy_front)
+    
+    neighbour_files = vector_file_fill(vector_sides(pawns))
+    bonus -= ISOLATED_PAWN_PENALTY*vector_count(pawns & ~neighbour_files)
+    
+    # no pawn beside or behind can defend it, and an enemy pawn guards the square in front
+    unsupported = pawns & neighbour_files & ~vector_north_fill(vector_sides(pawns))
+    enemy_attacks = vector_sides(enemy_pawns >> VECTOR_SHIFTS[8])
+    bonus -= BACKWARDS_PAWN_PENALTY*vector_count((unsupported << VECTOR_SHIFTS[8]) & enemy_attacks)
+    return bonus
+
+def vector_rook_bonus(rooks, open_files, semi_open_files, seventh_rank):
+    return ROOK_OPEN_FILE_BONUS*vector_count(rooks & open_files) + \
+           ROOK_SEMI_OPEN_FILE_BONUS*vector_count(rooks & semi_open_files) + \
+           ROOK_ON_SEVENTH_BONUS*vector_count(rooks & seventh_rank)
+
+def vectorized_evaluation(boards):
+    '''
+    material_balance + positional_balance of every board in an (N, 64) array from pack_boards,
+    as an int64 array. Like those, it leaves out checkmates and draws (see evaluate_game).
+    '''
+    require_numpy()
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, 64)
+    endgame = np.count_nonzero(boards, axis=1) <= ENDGAME_PIECE_COUNT
+    scores = VECTOR_SQUARE_SCORES[endgame.astype(np.intp)[:, None], boards, VECTOR_SQUARES].sum(axis=1)
+    
+    white_pawns = vector_bitboards(boards == WHITE|PAWN)
+    black_pawns = vector_bitboards(boards == BLACK|PAWN)
+    scores += vector_pawn_bonus(white_pawns, black_pawns) - \
+              vector_pawn_bonus(black_pawns.byteswap(), white_pawns.byteswap())
+    
+    pawns = white_pawns | black_pawns
+    stacked_pawns = pawns & (vector_south_fill(pawns) >> VECTOR_SHIFTS[8]) # pawns with another one above
+    open_files = ~vector_file_fill(pawns)
+    semi_open_files = ~open_files & ~vector_file_fill(stacked_pawns)
+    scores += vector_rook_bonus(vector_bitboards(boards == WHITE|ROOK), open_files, semi_open_files, VECTOR_RANK_7) - \
+              vector_rook_bonus(vector_bitboards(boards == BLACK|ROOK), open_files, semi_open_files, VECTOR_RANK_2)
+    return scores
+
+# ===========================
+
 def win_score(color):
     if color == WHITE:
         return -10*PIECE_VALUES[KING]
@@ -1089,25 +1739,147 @@ def legal_moves(game, color):
         if is_legal_move(game, move):
             yield move
 
+def squares_between(square_a, square_b):
+    line_atks = bishop_table_attacks(square_a, square_b)
+    if not line_atks & square_b:
+        line_atks = rook_table_attacks(square_a, square_b)
+        if not line_atks & square_b:
+            return 0
+        return line_atks & rook_table_attacks(square_b, square_a)
+    return line_atks & bishop_table_attacks(square_b, square_a)
+
+def get_pin_masks(board, king, color):
+    '''
+    Maps each piece of color pinned to its king to the squares it may still move to:
+    the line between king and pinner, pinner included.
+    '''
+    enemy = opposing_color(color)
+    pieces = board.piece_bb
+    enemy_pieces = get_colored_pieces(board, enemy)
+    own_pieces = get_colored_pieces(board, color)
+    diagonal_pinners = bishop_table_attacks(king, enemy_pieces) & \
+                       (pieces[enemy|BISHOP] | pieces[enemy|QUEEN] | pieces[enemy|JOKER])
+    straight_pinners = rook_table_attacks(king, enemy_pieces) & \
+                       (pieces[enemy|ROOK] | pieces[enemy|QUEEN] | pieces[enemy|JOKER])
+    
+    pin_masks = {}
+    for pinner in single_gen(diagonal_pinners | straight_pinners):
+        between = squares_between(king, pinner)
+        blockers = between & board.occupied
+        if blockers & own_pieces and not blockers & (blockers - 1):
+            pin_masks[blockers] = between | pinner
+    return pin_masks
+
+def generate_legal_moves(game, color):
+    for move in generate_packed_moves(game, color):
+        yield (SQUARE_BBS[move & 0x3F], SQUARE_BBS[move >> 6 & 0x3F])
+
+def generate_packed_moves(game, color):
+    '''
+    Yields the legal moves of color, packed, from the checkers, pinned pieces and check evasion
+    squares of the position, instead of playing and testing every pseudo-legal move.
+    '''
+    board = game.board
+    king = get_king(board, color)
+    if king == 0 or king & (king - 1):
+        for move in legal_moves(game, color):
+            yield pack_move(move, QUEEN if board[bb2index(move[0])]&PIECE_MASK == PAWN and move[1]&(RANK_1|RANK_8) else EMPTY)
+        return
+    
+    enemy = opposing_color(color)
+    own_pieces = get_colored_pieces(board, color)
+    checkers = get_attackers(king, board, enemy)
+    
+    # the king may not step along the ray of a slider checking it, so it is lifted off the board
+    king_index = bb2index(king)
+    board[king_index] = EMPTY
+    king_targets = [ target for target in single_gen(KING_ATTACKS[king] & nnot(own_pieces))
+                     if not is_attacked(target, board, enemy) ]
+    board[king_index] = color|KING
+    for target in king_targets:
+        yield king_index | bb2index(target) << 6
+    
+    if checkers & (checkers - 1): # double check
+        return
+    if checkers:
+        evasions = checkers | squares_between(king, checkers)
+    else:
+        evasions = ALL_SQUARES
+    pin_masks = get_pin_masks(board, king, color)
+    
+    for piece_pos in single_gen(own_pieces ^ king):
+        targets = get_moves(piece_pos, game, color)
+        piece_index = bb2index(piece_pos)
+        is_pawn = board[piece_index]&PIECE_MASK == PAWN
+        
+        # en passant can uncover a check along the captured pawn's rank, so it is played and tested
+        if game.ep_square & targets and is_pawn:
+            targets ^= game.ep_square
+            ep_move = piece_index | bb2index(game.ep_square) << 6
+            game.push(ep_move)
+            ep_legal = not is_check(board, color)
+            game.pop()
+            if ep_legal:
+                yield ep_move
+        
+        targets &= evasions & pin_masks.get(piece_pos, ALL_SQUARES)
+        for target in single_gen(targets):
+            if is_pawn and target&(RANK_1|RANK_8):
+                yield piece_index | bb2index(target) << 6 | QUEEN << 12
+            else:
+                yield piece_index | bb2index(target) << 6
+    
+    if not checkers:
+        if can_castle_kingside(game, color):
+            yield king_index | (king_index + 2) << 6
+        if can_castle_queenside(game, color):
+            yield king_index | (king_index - 2) << 6
+
 def is_legal_move(game, move):
-    new_game = make_move(game, move)
-    return not is_check(new_game.board, game.to_move)
+    color = game.to_move
+    game.push(move)
+    legal = not is_check(game.board, color)
+    game.pop()
+    return legal
     
 def count_legal_moves(game, color):
     move_count = 0
-    for _ in legal_moves(game, color):
+    for _ in generate_packed_moves(game, color):
         move_count += 1
     return move_count
 
+def perft(game, depth):
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return count_legal_moves(game, game.to_move)
+    
+    nodes = 0
+    for move in list(generate_packed_moves(game, game.to_move)):
+        game.push(move)
+        nodes += perft(game, depth-1)
+        game.pop()
+    return nodes
+
+def divide(game, depth):
+    move_nodes = {}
+    for move in list(generate_packed_moves(game, game.to_move)):
+        game.push(move)
+        move_nodes[move2uci(move)] = perft(game, depth-1)
+        game.pop()
+    return move_nodes
+
 def is_stalemate(game):
-    for _ in legal_moves(game, game.to_move):
-        return False
-    return not is_check(game.board, game.to_move)
+    game_status = status(game)
+    return game_status.legal_move_count == 0 and not game_status.in_check
   
 def is_checkmate(game, color):
-    for _ in legal_moves(game, game.to_move):
+    game_status = status(game)
+    if game_status.legal_move_count > 0:
         return False
-    return is_check(game.board, color)  
+    if color == game.to_move:
+        return game_status.in_check
+    return is_check(game.board, color)
 
 def is_same_position(FEN_a, FEN_b):
     FEN_a_list = FEN_a.split(' ')
@@ -1117,13 +1889,24 @@ def is_same_position(FEN_a, FEN_b):
            FEN_a_list[2] == FEN_b_list[2] and \
            FEN_a_list[3] == FEN_b_list[3]
 
+def is_repetition(game, count=2):
+    '''
+    True when the current position has occurred count times, itself included. Only the positions
+    since the last capture or pawn move are compared, as no earlier one can come back, and none from
+    before a null move, which push_null marks by restarting the halfmove clock.
+    '''
+    keys = game.key_history
+    key = keys[-1]
+    occurrences = 1
+    for i in range(len(keys)-3, max(len(keys)-game.halfmove_clock-2, -1), -2):
+        if keys[i] == key:
+            occurrences += 1
+            if occurrences >= count:
+                return True
+    return False
+
 def has_threefold_repetition(game):
-    current_pos = game.position_history[-1]
-    position_count = 0
-    for position in game.position_history:
-        if is_same_position(current_pos, position):
-            position_count += 1
-    return position_count >= 3
+    return is_repetition(game, 3)
 
 def is_under_50_move_rule(game):
     return game.halfmove_clock >= 100
@@ -1131,37 +1914,140 @@ def is_under_50_move_rule(game):
 def is_under_75_move_rule(game):
     return game.halfmove_clock >= 150
 
-def has_insufficient_material(game): # TODO: other insufficient positions
-    if material_sum(game.board, WHITE) + material_sum(game.board, BLACK) == 2*PIECE_VALUES[KING]:
+def has_insufficient_material(game):
+    '''
+    Neither side can mate: bare kings, a single knight or bishop, or only bishops, all on
+    squares of one colour (which covers king and bishop against king and bishop of the same colour).
+    '''
+    board = as_board(game.board)
+    knights = board.piece_bb[WHITE|KNIGHT] | board.piece_bb[BLACK|KNIGHT]
+    bishops = board.piece_bb[WHITE|BISHOP] | board.piece_bb[BLACK|BISHOP]
+    others = board.occupied & ~(board.piece_bb[WHITE|KING] | board.piece_bb[BLACK|KING])
+    if others & ~(knights | bishops):
+        return False
+    if count_pieces(others) <= 1:
         return True
-    if material_sum(game.board, WHITE) == PIECE_VALUES[KING]:
-        if material_sum(game.board, BLACK) == PIECE_VALUES[KING] + PIECE_VALUES[KNIGHT] and \
-        (get_knights(game.board, BLACK) != 0 or get_bishops(game.board, BLACK) != 0):
-            return True
-    if material_sum(game.board, BLACK) == PIECE_VALUES[KING]:
-        if material_sum(game.board, WHITE) == PIECE_VALUES[KING] + PIECE_VALUES[KNIGHT] and \
-        (get_knights(game.board, WHITE) != 0 or get_bishops(game.board, WHITE) != 0):
-            return True
-    return False
+    return not knights and (not bishops & LIGHT_SQUARES or not bishops & DARK_SQUARES)
+
+def tablebase_index(strong_to_move, strong_king, weak_king, piece_square):
+    return (((0 if strong_to_move else 1)*64 + strong_king)*64 + weak_king)*64 + piece_square
+
+tablebase = None
+
+def get_tablebase():
+    '''Loads the tables written by generate_tablebase.py on first use; empty when there are none.'''
+    global tablebase
+    if tablebase is None:
+        try:
+            with open(TABLEBASE_FILE, 'rb') as tablebase_file:
+                tablebase = decompress(tablebase_file.read())
+        except FileNotFoundError:
+            tablebase = b''
+    return tablebase
+
+def probe_tablebase(game):
+    '''
+    Looks up a position of king and queen, rook or pawn against a lone king. Returns its
+    TablebaseEntry, with plies to mate for wins and losses, or None when it is not covered.
+    '''
+    board = game.board
+    if count_pieces(board.occupied) != 3 or game.castling_rights or \
+       not board.piece_bb[WHITE|KING] or not board.piece_bb[BLACK|KING]:
+        return None
+    table = get_tablebase()
+    if not table:
+        return None
+    
+    for strong_color in [WHITE, BLACK]:
+        for table_number, piece in enumerate(TABLEBASE_PIECES):
+            if board.piece_bb[strong_color|piece]:
+                flip = 0 if strong_color == WHITE else 56 # the tables have the strong side playing up the board
+                value = table[table_number*TABLEBASE_SIZE +
+                              tablebase_index(game.to_move == strong_color,
+                                              bb2index(board.piece_bb[strong_color|KING]) ^ flip,
+                                              bb2index(board.piece_bb[opposing_color(strong_color)|KING]) ^ flip,
+                                              bb2index(board.piece_bb[strong_color|piece]) ^ flip)]
+                if value == 0:
+                    return TablebaseEntry(0, None)
+                plies = value - 1
+                return TablebaseEntry(1 if plies % 2 else -1, plies)
+    return None
+
+def tablebase_score(game):
+    '''Score of a tablebase position, mates further away scoring a little less; None when it is not covered.'''
+    entry = probe_tablebase(game)
+    if entry is None:
+        return None
+    if entry.outcome == 0:
+        return 0
+    winner = game.to_move if entry.outcome == 1 else opposing_color(game.to_move)
+    if winner == WHITE:
+        return win_score(BLACK) - entry.plies
+    return win_score(WHITE) + entry.plies
+
+def tablebase_move(game):
+    '''Plays the fastest win, or else a draw, or else the slowest loss, when the position is in the tablebase.'''
+    if probe_tablebase(game) is None:
+        return None
+    
+    def move_order(move):
+        game.push(move)
+        entry = probe_tablebase(game)
+        game.pop()
+        if entry is None or entry.outcome == 0: # captures leave bare kings
+            return (1, 0)
+        if entry.outcome == -1:
+            return (0, entry.plies)
+        return (2, -entry.plies)
+    
+    return min(generate_packed_moves(game, game.to_move), key=move_order, default=None)
 
 def game_ended(game):
-    return is_checkmate(game, WHITE) or \
-           is_checkmate(game, BLACK) or \
-           is_stalemate(game) or \
-           has_insufficient_material(game) or \
-           is_under_75_move_rule(game)
+    return status(game).ended
+
+def status(game):
+    '''
+    Termination status of the current position, computed once and kept on the game
+    until its position (Zobrist key and halfmove clock) changes.
+    '''
+    position = (game.zobrist_key(), game.halfmove_clock)
+    if game.status_cache is not None and game.status_cache[0] == position:
+        return game.status_cache[1]
+    
+    in_check = is_check(game.board, game.to_move)
+    legal_move_count = count_legal_moves(game, game.to_move)
+    
+    outcome = None
+    if legal_move_count == 0:
+        if not in_check:
+            outcome = 'Draw by stalemate'
+        elif is_check(game.board, WHITE):
+            outcome = 'BLACK wins!'
+        else:
+            outcome = 'WHITE wins!'
+    elif has_insufficient_material(game):
+        outcome = 'Draw by insufficient material!'
+    elif is_under_75_move_rule(game):
+        outcome = 'Draw by 75-move rule!'
+    
+    game_status = GameStatus(outcome is not None, outcome, in_check, legal_move_count)
+    game.status_cache = (position, game_status)
+    return game_status
 
 def random_move(game, color):
-    return choice(legal_moves(game, color))
+    return choice(list(generate_legal_moves(game, color)))
 
 def evaluated_move(game, color):
     best_score = win_score(color)
     best_moves = []
     
-    for move in legal_moves(game, color):
-        evaluation = evaluate_game(make_move(game, move))
+    for move in generate_legal_moves(game, color):
+        game.push(move)
+        evaluation = evaluate_game(game)
+        mate = is_checkmate(game, game.to_move)
+        game.pop()
         
-        if is_checkmate(make_move(game, move), opposing_color(game.to_move)):
+        if mate:
             return [move, evaluation]
         
         if (color == WHITE and evaluation > best_score) or \
@@ -1186,13 +2072,15 @@ def minimax(game, color, depth=1):
     best_score = win_score(color)
     best_moves = []
     
-    for move in legal_moves(game, color):
-        his_game = make_move(game, move)
+    for move in generate_legal_moves(game, color):
+        game.push(move)
         
-        if is_checkmate(his_game, his_game.to_move):
-            return [move, win_score(his_game.to_move)]
+        if is_checkmate(game, game.to_move):
+            game.pop()
+            return [move, win_score(opposing_color(color))]
             
-        [_, evaluation] = minimax(his_game, opposing_color(color), depth-1)
+        [_, evaluation] = minimax(game, opposing_color(color), depth-1)
+        game.pop()
         
         if evaluation == win_score(opposing_color(color)):
             return [move, evaluation]
@@ -1206,25 +2094,68 @@ def minimax(game, color, depth=1):
         
     return [choice(best_moves), best_score]
 
-def alpha_beta(game, color, depth, alpha=-float('inf'), beta=float('inf')):
+def alpha_beta(game, color, depth, alpha=-float('inf'), beta=float('inf'), table=None, search=None):
+    if search is None:
+        search = Search()
+    if search.root_ply is None:
+        search.root_ply = len(game.undo_stack)
+        search.root_depth = depth
+    search.count_node()
+    if len(game.undo_stack) != search.root_ply and is_repetition(game):
+        return [None, 0]
+    if table is None or depth == 0:
+        return alpha_beta_search(game, color, depth, alpha, beta, table, None, search)
+    
+    key = game.zobrist_key()
+    entry = table.probe(key)
+    tt_move = None
+    if entry is not None:
+        [_, entry_depth, entry_score, entry_bound, tt_move] = entry
+        if entry_depth >= depth:
+            if entry_bound == EXACT_BOUND or \
+               (entry_bound == LOWER_BOUND and entry_score >= beta) or \
+               (entry_bound == UPPER_BOUND and entry_score <= alpha):
+                return [tt_move, entry_score]
+    
+    [move, score] = alpha_beta_search(game, color, depth, alpha, beta, table, tt_move, search)
+    
+    if score <= alpha:
+        bound = UPPER_BOUND
+    elif score >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT_BOUND
+    table.store(key, depth, score, bound, move)
+    return [move, score]
+
+def alpha_beta_search(game, color, depth, alpha, beta, table, tt_move, search):
     if game_ended(game):
         return [None, evaluate_game(game)]
     
-    [simple_move, simple_evaluation] = evaluated_move(game, color)
+    score = tablebase_score(game) if len(game.undo_stack) != search.root_ply else None
+    if score is not None:
+        return [None, score]
+    
+    if depth == 0:
+        return [None, quiescence(game, color, alpha, beta, QUIESCENCE_DEPTH, search)]
+    
+    in_check = status(game).in_check
+    if null_move_cutoff(game, color, depth, alpha, beta, table, search, in_check):
+        return [None, beta if color == WHITE else alpha]
+
+    moves = order_moves(game, list(generate_packed_moves(game, color)), tt_move, search)
+    # the root searches one point past its bound, so that a move failing low scores below
+    # the best one instead of tying with it
+    tie_margin = 1 if len(game.undo_stack) == search.root_ply else 0
     
-    if depth == 1 or \
-       simple_evaluation == win_score(opposing_color(color)):
-        return [simple_move, simple_evaluation]
-
     best_moves = []
         
     if color == WHITE:
-        for move in legal_moves(game, color):
+        for move_number, move in enumerate(moves):
             if verbose:
-                print('\t'*depth + str(depth) + '. evaluating ' + PIECE_CODES[get_piece(game.board, move[0])] + move2str(move))
+                print('\t'*depth + str(depth) + '. evaluating ' + PIECE_CODES[game.board[move & 0x3F]] + move2uci(move))
                 
-            new_game = make_move(game, move)
-            [_, score] = alpha_beta(new_game, opposing_color(color), depth-1, alpha, beta)
+            score = search_move(game, color, move, move_number, depth, alpha - tie_margin, beta, table, search, in_check)
             
             if verbose:
                 print('\t'*depth + str(depth) + '. ' + str(score) + ' [{},{}]'.format(alpha, beta))
@@ -1237,9 +2168,10 @@ def alpha_beta(game, color, depth, alpha=-float('inf'), beta=float('inf')):
             if score > alpha: # white maximizes her score
                 alpha = score
                 best_moves = [move]
-                if alpha > beta: # alpha-beta cutoff
+                if alpha >= beta: # alpha-beta cutoff
                     if verbose:
                         print('\t'*depth + 'cutoff')
+                    search.record_cutoff(game, move, depth, move_number)
                     break
         if best_moves:
             return [choice(best_moves), alpha]
@@ -1247,12 +2179,11 @@ def alpha_beta(game, color, depth, alpha=-float('inf'), beta=float('inf')):
             return [None, alpha]
     
     if color == BLACK:
-        for move in legal_moves(game, color):
+        for move_number, move in enumerate(moves):
             if verbose:
-                print('\t'*depth + str(depth) + '. evaluating ' + PIECE_CODES[get_piece(game.board, move[0])] + move2str(move))
+                print('\t'*depth + str(depth) + '. evaluating ' + PIECE_CODES[game.board[move & 0x3F]] + move2uci(move))
                 
-            new_game = make_move(game, move)
-            [_, score] = alpha_beta(new_game, opposing_color(color), depth-1, alpha, beta)
+            score = search_move(game, color, move, move_number, depth, alpha, beta + tie_margin, table, search, in_check)
             
             if verbose:
                 print('\t'*depth + str(depth) + '. ' + str(score) + ' [{},{}]'.format(alpha, beta))
@@ -1265,15 +2196,355 @@ def alpha_beta(game, color, depth, alpha=-float('inf'), beta=float('inf')):
             if score < beta: # black minimizes his score
                 beta = score
                 best_moves = [move]
-                if alpha > beta: # alpha-beta cutoff
+                if alpha >= beta: # alpha-beta cutoff
                     if verbose:
                         print('\t'*depth + 'cutoff')
+                    search.record_cutoff(game, move, depth, move_number)
                     break
         if best_moves:
             return [choice(best_moves), beta]
         else:
             return [None, beta]
 
+def search_move(game, color, move, move_number, depth, alpha, beta, table, search, in_check):
+    '''
+    Plays move and returns its score at depth-1, plus a ply when it gives check, or searched
+    shallower first with a null window when it is a late quiet move (re-searched at depth-1
+    if it beats the bound). Which of these apply is set by search.options.
+    '''
+    options = search.options
+    ply = len(game.undo_stack)
+    late_quiet_move = options.late_move_reductions and ply != search.root_ply and not in_check and \
+                      move_number >= LATE_MOVE_NUMBER and depth >= LATE_MOVE_MIN_DEPTH and \
+                      not move >> 12 and not is_capture(game, move) and move not in search.killers.get(ply, [])
+    
+    game.push(move)
+    gives_check = is_check(game.board, game.to_move)
+    child_depth = depth-1
+    if gives_check and options.check_extensions and ply - search.root_ply < 2*search.root_depth:
+        child_depth += 1
+    
+    score = None
+    if late_quiet_move and not gives_check:
+        if color == WHITE:
+            [_, score] = alpha_beta(game, BLACK, depth-2, alpha, alpha + 1, table, search)
+            if score > alpha:
+                score = None
+        else:
+            [_, score] = alpha_beta(game, WHITE, depth-2, beta - 1, beta, table, search)
+            if score < beta:
+                score = None
+    if score is None:
+        [_, score] = alpha_beta(game, opposing_color(color), child_depth, alpha, beta, table, search)
+    game.pop()
+    return score
+
+def null_move_cutoff(game, color, depth, alpha, beta, table, search, in_check):
+    '''
+    Null-move pruning: if the side to move, passing its turn, still scores past the bound with a
+    shallower search, a real move would too. Not tried in check, right after another null move,
+    or with only king and pawns, where passing may be the best move there is (zugzwang).
+    '''
+    board = game.board
+    if not search.options.null_move or in_check or depth < NULL_MOVE_MIN_DEPTH or \
+       len(game.undo_stack) == search.root_ply or game.undo_stack[-1] & 0x7FFF == NULL_MOVE or \
+       not board.color_bb[color >> 3] & ~(board.piece_bb[color|PAWN] | board.piece_bb[color|KING]):
+        return False
+    
+    static_score = evaluate_game(game)
+    if (color == WHITE and static_score < beta) or (color == BLACK and static_score > alpha):
+        return False
+    
+    game.push_null()
+    if color == WHITE:
+        [_, score] = alpha_beta(game, BLACK, depth-1-NULL_MOVE_REDUCTION, beta - 1, beta, table, search)
+    else:
+        [_, score] = alpha_beta(game, WHITE, depth-1-NULL_MOVE_REDUCTION, alpha, alpha + 1, table, search)
+    game.pop()
+    return score >= beta if color == WHITE else score <= alpha
+
+def quiescence(game, color, alpha, beta, depth, search):
+    '''
+    Searches captures only (every evasion when in check) until the position is quiet, so that
+    leaves are not evaluated in the middle of an exchange. The side to move may stand pat on
+    the static evaluation instead of capturing. Gives up after depth captures.
+    Returns the best score found even outside [alpha, beta], so that alpha_beta can cut off on it.
+    '''
+    if game_ended(game):
+        return evaluate_game(game)
+    
+    score = tablebase_score(game)
+    if score is not None:
+        return score
+    
+    in_check = status(game).in_check
+    stand_pat = evaluate_game(game)
+    if in_check and depth > 0:
+        best_score = win_score(color)
+    else:
+        best_score = stand_pat
+        if depth == 0 or \
+           (color == WHITE and best_score >= beta) or \
+           (color == BLACK and best_score <= alpha):
+            return best_score
+    
+    if in_check:
+        moves = list(generate_packed_moves(game, color))
+    else:
+        moves = [ move for move in generate_packed_moves(game, color) if is_capture(game, move) ]
+    
+    for move in order_moves(game, moves, None, search):
+        if not in_check:
+            victim = game.board[move >> 6 & 0x3F]&PIECE_MASK
+            victim_value = PIECE_VALUES[victim if victim != EMPTY else PAWN]
+            # delta pruning
+            if (color == WHITE and stand_pat + victim_value + DELTA_MARGIN < alpha) or \
+               (color == BLACK and stand_pat - victim_value - DELTA_MARGIN > beta):
+                continue
+            # a defended piece taken by a more valuable one loses material
+            if PIECE_VALUES[game.board[move & 0x3F]&PIECE_MASK] > victim_value and \
+               is_attacked(SQUARE_BBS[move >> 6 & 0x3F], game.board, opposing_color(color)):
+                continue
+        
+        search.count_node()
+        game.push(move)
+        score = quiescence(game, opposing_color(color), max(alpha, best_score) if color == WHITE else alpha,
+                           min(beta, best_score) if color == BLACK else beta, depth-1, search)
+        game.pop()
+        
+        if (color == WHITE and score > best_score) or \
+           (color == BLACK and score < best_score):
+            best_score = score
+        if (color == WHITE and best_score >= beta) or \
+           (color == BLACK and best_score <= alpha):
+            break
+    
+    return best_score
+
+def is_capture(game, move):
+    target = SQUARE_BBS[move >> 6 & 0x3F]
+    return bool(target & get_colored_pieces(game.board, opposing_color(game.to_move))) or \
+           (target == game.ep_square and game.board[move & 0x3F]&PIECE_MASK == PAWN)
+
+def order_moves(game, moves, tt_move, search):
+    '''
+    Sorts moves so that cutoffs come early: the transposition table move first, then captures
+    by most valuable victim / least valuable attacker, then the killer moves of this ply, then
+    the remaining quiet moves by history score.
+    '''
+    if not move_ordering:
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+    
+    board = game.board
+    killers = search.killers.get(len(game.undo_stack), [])
+    
+    def move_order(move):
+        if move == tt_move:
+            return (0, 0, 0)
+        if is_capture(game, move):
+            victim = board[move >> 6 & 0x3F]&PIECE_MASK
+            attacker = board[move & 0x3F]&PIECE_MASK
+            return (1, -PIECE_VALUES[victim if victim != EMPTY else PAWN], PIECE_VALUES[attacker])
+        if move in killers:
+            return (2, killers.index(move), 0)
+        return (3, -search.history.get(move, 0), 0)
+    
+    return sorted(moves, key=move_order)
+
+class SearchAborted(Exception):
+    pass
+
+class Search:
+    '''
+    Node counter, limits and options shared by one search: count_node() raises SearchAborted
+    once the node budget is spent or the deadline has passed.
+    '''
+    def __init__(self, deadline=None, node_limit=None, killers=None, history=None, options=SELECTIVE_SEARCH):
+        self.deadline = deadline
+        self.node_limit = node_limit
+        self.options = options
+        self.nodes = 0
+        self.root_ply = None
+        self.root_depth = None
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.killers = killers if killers is not None else {}
+        self.history = history if history is not None else {}
+    
+    def count_node(self):
+        self.nodes += 1
+        if (self.node_limit is not None and self.nodes > self.node_limit) or \
+           (self.deadline is not None and time() > self.deadline):
+            raise SearchAborted()
+    
+    def record_cutoff(self, game, move, depth, move_number):
+        '''Counts a beta cutoff and, for a quiet move, keeps it as a killer and in the history.'''
+        self.cutoffs += 1
+        if move_number == 0:
+            self.first_move_cutoffs += 1
+        if is_capture(game, move):
+            return
+        
+        killers = self.killers.setdefault(len(game.undo_stack), [])
+        if move in killers:
+            killers.remove(move)
+        killers.insert(0, move)
+        del killers[KILLER_SLOTS:]
+        self.history[move] = self.history.get(move, 0) + depth*depth
+
+SearchIteration = namedtuple('SearchIteration', ['depth', 'move', 'score', 'nodes', 'seconds', 'pv'])
+
+def iterative_deepening(game, max_depth, time_budget=None, node_budget=None, table=None, options=SELECTIVE_SEARCH):
+    '''
+    Runs alpha_beta at depth 1, 2, ..., max_depth until the time budget (seconds) or node
+    budget runs out, and returns [move, score, iterations] from the last completed iteration.
+    Each iteration's principal variation is kept in the transposition table, which orders
+    the moves of the next one, together with the killer moves and history scores.
+    Depth 1 always completes.
+    '''
+    if table is None:
+        table = get_transposition_table(game)
+    start_time = time()
+    deadline = start_time + time_budget if time_budget is not None else None
+    ply = len(game.undo_stack)
+    
+    move, score = None, None
+    iterations = []
+    total_nodes = 0
+    killers, history = {}, {}
+    for depth in range(1, max_depth+1):
+        if depth == 1:
+            search = Search(killers=killers, history=history, options=options)
+        else:
+            search = Search(deadline, node_budget - total_nodes if node_budget is not None else None, killers, history, options)
+        iteration_start = time()
+        try:
+            [iteration_move, iteration_score] = alpha_beta(game, game.to_move, depth, table=table, search=search)
+        except SearchAborted:
+            while len(game.undo_stack) > ply:
+                game.pop()
+            break
+        finally:
+            total_nodes += search.nodes
+        
+        move, score = iteration_move, iteration_score
+        iterations.append(SearchIteration(depth, move, score, search.nodes, time()-iteration_start,
+                                          principal_variation(game, table, depth)))
+        if verbose:
+            print('depth {}: {} ({}) {} nodes in {:.3f} seconds, {} cutoffs ({} on the first move), pv {}'.format(
+                  depth, move2uci(move), score, search.nodes, iterations[-1].seconds,
+                  search.cutoffs, search.first_move_cutoffs, ' '.join(iterations[-1].pv)))
+        if score in (win_score(WHITE), win_score(BLACK)):
+            break
+    return [move, score, iterations]
+
+# per-process state of the parallel search workers, set by init_search_worker
+search_worker_bound = None
+search_worker_table = None
+
+def init_search_worker(shared_bound):
+    global search_worker_bound, search_worker_table
+    search_worker_bound = shared_bound
+    search_worker_table = TranspositionTable()
+
+def search_root_moves(game, moves, depth, deadline, node_limit, options):
+    '''
+    Searches some of the root moves of game in a worker process. Each move is searched from the
+    best root score any worker has found so far, read from the shared bound, and raises it when
+    it does better. Returns [[[move, score], ...], nodes], with None for the scores when the
+    deadline or node limit ran out.
+    '''
+    color = game.to_move
+    search = Search(deadline, node_limit, options=options)
+    search.root_ply = len(game.undo_stack)
+    search.root_depth = depth
+    scored_moves = []
+    try:
+        for move in moves:
+            bound = search_worker_bound.value
+            game.push(move)
+            # searched one point past the bound, so that a move failing low cannot tie with the best
+            if color == WHITE:
+                [_, score] = alpha_beta(game, BLACK, depth-1, bound - 1, float('inf'), search_worker_table, search)
+            else:
+                [_, score] = alpha_beta(game, WHITE, depth-1, -float('inf'), bound + 1, search_worker_table, search)
+            game.pop()
+            scored_moves.append([move, score])
+            
+            with search_worker_bound.get_lock():
+                if (color == WHITE and score > search_worker_bound.value) or \
+                   (color == BLACK and score < search_worker_bound.value):
+                    search_worker_bound.value = score
+    except SearchAborted:
+        return [None, search.nodes]
+    return [scored_moves, search.nodes]
+
+def parallel_search(game, max_depth, workers, time_budget=None, node_budget=None, options=SELECTIVE_SEARCH):
+    '''
+    Iterative deepening that deals the root moves out to a pool of worker processes at every
+    depth, best moves of the previous iteration first. Workers share the best root score through
+    a multiprocessing Value and keep their own transposition tables between iterations.
+    Returns [move, score, iterations] like iterative_deepening.
+    '''
+    color = game.to_move
+    moves = order_moves(game, list(generate_packed_moves(game, color)), None, Search())
+    if not moves:
+        return [None, evaluate_game(game), []]
+    
+    root = game.copy()
+    root.transposition_table = None
+    root.pawn_table = None
+    start_time = time()
+    deadline = start_time + time_budget if time_budget is not None else None
+    shared_bound = Value('d', 0)
+    
+    move, score = None, None
+    iterations = []
+    total_nodes = 0
+    with ProcessPoolExecutor(workers, initializer=init_search_worker, initargs=(shared_bound,)) as pool:
+        for depth in range(1, max_depth+1):
+            shared_bound.value = win_score(color)
+            chunks = [ moves[i::workers] for i in range(min(workers, len(moves))) ]
+            node_limit = None
+            if node_budget is not None and depth > 1:
+                node_limit = (node_budget - total_nodes) // len(chunks)
+            iteration_start = time()
+            results = list(pool.map(search_root_moves, [root]*len(chunks), chunks, [depth]*len(chunks),
+                                    [deadline if depth > 1 else None]*len(chunks), [node_limit]*len(chunks), [options]*len(chunks)))
+            
+            nodes = sum(result[1] for result in results)
+            total_nodes += nodes
+            if any(result[0] is None for result in results):
+                break
+            
+            scored_moves = [ scored_move for result in results for scored_move in result[0] ]
+            scored_moves.sort(key=lambda scored_move: scored_move[1], reverse=(color == WHITE))
+            score = scored_moves[0][1]
+            move = choice([ scored_move[0] for scored_move in scored_moves if scored_move[1] == score ])
+            moves = [ scored_move[0] for scored_move in scored_moves ]
+            iterations.append(SearchIteration(depth, move, score, nodes, time()-iteration_start, [move2uci(move)]))
+            if verbose:
+                print('depth {}: {} ({}) {} nodes in {:.3f} seconds on {} workers'.format(
+                      depth, move2uci(move), score, nodes, iterations[-1].seconds, len(chunks)))
+            if score in (win_score(WHITE), win_score(BLACK)):
+                break
+    return [move, score, iterations]
+
+def principal_variation(game, table, depth):
+    pv = []
+    for _ in range(depth):
+        entry = table.probe(game.zobrist_key())
+        if entry is None or entry[4] is None or entry[4] not in list(generate_packed_moves(game, game.to_move)):
+            break
+        game.push(entry[4])
+        pv.append(move2uci(entry[4]))
+    for _ in pv:
+        game.pop()
+    return pv
+
 def parse_move_code(game, move_code):
     move_code = move_code.replace(" ","")
     move_code = move_code.replace("x","")
@@ -1313,7 +2584,7 @@ def parse_move_code(game, move_code):
             return False
     
     valid_moves = []
-    for move in legal_moves(game, game.to_move):
+    for move in generate_legal_moves(game, game.to_move):
         if move[1] & target_square and \
            move[0] & filter_squares and \
            get_piece(game.board, move[0])&PIECE_MASK == piece:
@@ -1332,16 +2603,22 @@ def get_player_move(game):
             print('Invalid move!')
     return move
 
-def get_AI_move(game, depth=2):
+def get_AI_move(game, depth=2, time_budget=None, node_budget=None, workers=1, options=SELECTIVE_SEARCH):
     if verbose:
         print('Searching best move for white...' if game.to_move == WHITE else 'Searching best move for black...')
     start_time = time()
 
-    if find_in_book(game):
-        move = get_book_move(game)
-    else:
+    move = tablebase_move(game)
+    if move is None and find_in_book(game):
+        move = pack_move(get_book_move(game))
+    if move is None:
 #         move = minimax(game, game.to_move, depth)[0]
-        move = alpha_beta(game, game.to_move, depth)[0]
+        if workers > 1:
+            move = parallel_search(game, depth, workers, time_budget, node_budget, options)[0]
+        else:
+            move = iterative_deepening(game, depth, time_budget, node_budget, options=options)[0]
+    if move is not None:
+        move = unpack_move(move)
 
     end_time = time()
     if verbose:
@@ -1352,16 +2629,7 @@ def print_outcome(game):
     print(get_outcome(game))
     
 def get_outcome(game):
-    if is_stalemate(game):
-        return 'Draw by stalemate'
-    if is_checkmate(game, WHITE):
-        return 'BLACK wins!'
-    if is_checkmate(game, BLACK):
-        return 'WHITE wins!'
-    if has_insufficient_material(game):
-        return 'Draw by insufficient material!'
-    if is_under_75_move_rule(game):
-        return 'Draw by 75-move rule!'
+    return status(game).outcome
 
 def play_as_white(game=Game()):
     print('Playing as white!')
@@ -1418,25 +2686,121 @@ def play_random_color():
     color = choice([WHITE, BLACK])
     play_as(color)
 
-def find_in_book(game):
-    if game.position_history[0] != INITIAL_FEN:
-        return False
+class OpeningBook:
+    '''
+    Book moves by position, built once from lines of moves played from the initial position:
+    positions[Zobrist key] = { move: number of book lines playing move from that position }
+    '''
+    def __init__(self, lines=()):
+        self.positions = {}
+        for line in lines:
+            self.add_line(line)
+    
+    def add_line(self, line):
+        game = Game()
+        for move_str in line.split():
+            move = (str2bb(move_str[:2]), str2bb(move_str[2:4]))
+            book_moves = self.positions.setdefault(game.zobrist_key(), {})
+            book_moves[move] = book_moves.get(move, 0) + 1
+            game.push(move)
+    
+    def get_moves(self, game):
+        return self.positions.get(game.zobrist_key(), {})
+
+class BinaryOpeningBook:
+    '''
+    Opening book compiled by compile_book.py into sorted fixed-width BOOK_ENTRY records.
+    The file is memory-mapped and binary-searched, so processes share one page-cached copy.
+    '''
+    def __init__(self, book_file):
+        self.book = mmap(book_file.fileno(), 0, access=ACCESS_READ)
+        self.size = len(self.book) // BOOK_ENTRY.size
     
-    openings = []
-    book_file = open("book.txt")
-    for line in book_file:
-        if line.startswith(game.get_move_list()) and line.rstrip() > game.get_move_list():
-            openings.append(line.rstrip())
-    book_file.close()
-    return openings
+    def key_at(self, index):
+        return BOOK_ENTRY.unpack_from(self.book, index*BOOK_ENTRY.size)[0]
+    
+    def get_moves(self, game):
+        key = game.zobrist_key()
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        
+        book_moves = {}
+        for index in range(low, self.size):
+            (entry_key, move_code, weight) = BOOK_ENTRY.unpack_from(self.book, index*BOOK_ENTRY.size)
+            if entry_key != key:
+                break
+            book_moves[unpack_move(move_code)] = weight
+        return book_moves
+
+opening_book = None
+
+def get_opening_book():
+    '''Loads the opening book on first use: the compiled BINARY_BOOK_FILE if there is one, else BOOK_FILE.'''
+    global opening_book
+    if opening_book is None:
+        try:
+            with open(BINARY_BOOK_FILE, 'rb') as book_file:
+                opening_book = BinaryOpeningBook(book_file)
+        except (FileNotFoundError, ValueError): # ValueError: an empty file cannot be mapped
+            try:
+                with open(BOOK_FILE) as book_file:
+                    opening_book = OpeningBook(book_file)
+            except FileNotFoundError:
+                opening_book = OpeningBook()
+    return opening_book
+
+def find_in_book(game):
+    return get_opening_book().get_moves(game)
 
 def get_book_move(game):
-    openings = find_in_book(game)
-    chosen_opening = choice(openings)
-    next_moves = chosen_opening.replace(game.get_move_list(), '').lstrip()
-    move_str = next_moves.split(' ')[0]
-    move = [str2bb(move_str[:2]), str2bb(move_str[-2:])]
-    return move
+    book_moves = find_in_book(game)
+    return choices(list(book_moves), list(book_moves.values()))[0]
+
+def analyze_chunk(FENs):
+    '''
+    Analyses a list of FENs in one process, sharing a pawn table between them. A FEN that cannot be
+    read gets a result holding only the error, so the rest of the chunk is still analysed.
+    '''
+    pawn_table = PawnTable()
+    results = []
+    for FEN in FENs:
+        try:
+            game = Game(FEN)
+        except ValueError as error:
+            results.append(PositionAnalysis(FEN, None, None, None, None, None, str(error)))
+            continue
+        game.pawn_table = pawn_table
+        game_status = status(game)
+        results.append(PositionAnalysis(FEN, evaluate_game(game), game_status.legal_move_count,
+                                        game_status.in_check, game_status.ended, game_status.outcome))
+    return results
+
+def analyze_positions(FENs, workers=1, chunk_size=ANALYSIS_CHUNK_SIZE):
+    '''
+    Yields a PositionAnalysis (static evaluation, legal move count and status, or the error for a FEN
+    that cannot be read) for each FEN, in order.
+    FENs may be any iterable and is read chunk_size positions at a time; with workers > 1 the chunks
+    are analysed in a process pool, keeping at most two chunks per worker in flight.
+    '''
+    FENs = iter(FENs)
+    chunks = iter(lambda: list(islice(FENs, chunk_size)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from analyze_chunk(chunk)
+        return
+    
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque(pool.submit(analyze_chunk, chunk) for chunk in islice(chunks, 2*workers))
+        while pending:
+            results = pending.popleft().result()
+            for chunk in islice(chunks, 1):
+                pending.append(pool.submit(analyze_chunk, chunk))
+            yield from results
 
 
 
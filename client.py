@@ -266,7 +266,7 @@ def play_game():
                             dragged_piece_img = pygame.transform.scale(dragged_piece_img, (SQUARE_SIDE, SQUARE_SIDE))
                             dragged_piece_rect = dragged_piece_img.get_rect(center=event.pos)
                             piece_bb = chess.str2bb(leaving_square)
-                            for move in chess.legal_moves(game, player_state['color']):
+                            for move in chess.generate_legal_moves(game, player_state['color']):
                                 if move[0] == piece_bb:
                                     highlighted_squares.append(chess.bb2str(move[1]))
                             redraw_needed = True
@@ -152,7 +152,7 @@ def play_game():
                         if p!=chess.EMPTY and (p&chess.COLOR_MASK)==game_state['my_color']:
                             dragged_piece.update({'leaving_square':sq,'image':pygame.transform.scale(piece_images[p],(SQUARE_SIDE,SQUARE_SIDE))})
                             dragged_piece['rect'] = dragged_piece['image'].get_rect(center=event.pos)
-                            for move in chess.legal_moves(game, game_state['my_color']):
+                            for move in chess.generate_legal_moves(game, game_state['my_color']):
                                 if move[0] == chess.str2bb(sq): highlighted_squares.append(chess.bb2str(move[1]))
                 elif event.type == pygame.MOUSEMOTION and dragged_piece['image']: dragged_piece['rect'].center=event.pos
                 elif event.type == pygame.MOUSEBUTTONUP and event.button==1 and dragged_piece['leaving_square']:
@@ -0,0 +1,99 @@
+'''
+Compiles opening lines into the binary book read by chess.find_in_book.
+
+usage: python compile_book.py [book.txt ...] [--pgn games.pgn ...] [--plies N] [-o book.bin]
+Text books hold one line of moves per row, as in book.txt (e2e4 e7e5 g1f3 ...).
+PGN games contribute their first N plies. Every position on a line gets one
+entry per move played from it, weighted by the number of lines playing it.
+'''
+import re
+from argparse import ArgumentParser
+import chess
+
+PGN_PLIES = 20
+MAX_WEIGHT = 0xFFFF
+
+PGN_RESULTS = [ '1-0', '0-1', '1/2-1/2', '*' ]
+PGN_COMMENT = re.compile(r'\{[^}]*\}|;[^\n]*')
+PGN_TAG = re.compile(r'^\s*\[.*\]\s*$', re.MULTILINE)
+PGN_MOVE_NUMBER = re.compile(r'^\d+\.+')
+SAN_SUFFIX = re.compile(r'(=[QRBN])?[+#!?]*$')
+
+def text_lines(path):
+    with open(path) as book_file:
+        for line in book_file:
+            if line.strip():
+                yield chess.Game(), [ (chess.str2bb(move_str[:2]), chess.str2bb(move_str[2:4])) for move_str in line.split() ]
+
+def pgn_games(text):
+    '''Yields the SAN moves of each game in a PGN text, leaving out comments, variations and annotations.'''
+    text = PGN_TAG.sub(' ', PGN_COMMENT.sub(' ', text))
+    moves = []
+    variation_depth = 0
+    for token in text.replace('(', ' ( ').replace(')', ' ) ').split():
+        if token == '(':
+            variation_depth += 1
+        elif token == ')':
+            variation_depth -= 1
+        elif variation_depth > 0 or token.startswith('$'):
+            continue
+        elif token in PGN_RESULTS:
+            yield moves
+            moves = []
+        else:
+            token = PGN_MOVE_NUMBER.sub('', token)
+            if token:
+                moves.append(SAN_SUFFIX.sub('', token))
+    if moves:
+        yield moves
+
+def pgn_lines(path, plies):
+    with open(path) as pgn_file:
+        text = pgn_file.read()
+    for san_moves in pgn_games(text):
+        game = chess.Game()
+        moves = []
+        for san in san_moves[:plies]:
+            move = chess.parse_move_code(game, san)
+            if not move:
+                break
+            moves.append(move)
+            game.push(move)
+        yield chess.Game(), moves
+
+def count_book_moves(lines):
+    '''Counts {(Zobrist key, move code): number of lines} over (game, moves) lines.'''
+    counts = {}
+    for game, moves in lines:
+        for move in moves:
+            entry = (game.zobrist_key(), chess.pack_move(move))
+            counts[entry] = counts.get(entry, 0) + 1
+            game.push(move)
+    return counts
+
+def write_book(counts, path):
+    with open(path, 'wb') as book_file:
+        for (key, move_code) in sorted(counts):
+            book_file.write(chess.BOOK_ENTRY.pack(key, move_code, min(counts[(key, move_code)], MAX_WEIGHT)))
+
+def compile_book(text_paths, pgn_paths, output_path, plies=PGN_PLIES):
+    lines = []
+    for path in text_paths:
+        lines.extend(text_lines(path))
+    for path in pgn_paths:
+        lines.extend(pgn_lines(path, plies))
+    counts = count_book_moves(lines)
+    write_book(counts, output_path)
+    return len(lines), len(counts)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Compiles opening lines into a binary book.')
+    parser.add_argument('books', nargs='*', help='text books with one line of moves per row')
+    parser.add_argument('--pgn', nargs='*', default=[], help='PGN files')
+    parser.add_argument('--plies', type=int, default=PGN_PLIES, help='plies taken from each PGN game (default: {})'.format(PGN_PLIES))
+    parser.add_argument('-o', '--output', default=chess.BINARY_BOOK_FILE, help='binary book to write (default: {})'.format(chess.BINARY_BOOK_FILE))
+    args = parser.parse_args()
+    if not args.books and not args.pgn:
+        parser.error('nothing to compile')
+    [line_count, entry_count] = compile_book(args.books, args.pgn, args.output, args.plies)
+    print('{} lines, {} entries written to {}'.format(line_count, entry_count, args.output))
@@ -0,0 +1,145 @@
+'''
+Generates the endgame tablebase probed by chess.probe_tablebase.
+
+usage: python generate_tablebase.py [-o tablebase.bin]
+Solves king and queen, king and rook, and king and pawn against a lone king by
+retrograde analysis: starting from the checkmates, positions are resolved one
+ply further back at a time until no more can be won. Pawns promote to queens,
+as everywhere in the engine, so the queen table is solved before the pawn one.
+'''
+import zlib
+from argparse import ArgumentParser
+import chess
+
+SQUARES = range(64)
+PAWN_SQUARES = range(8, 56)
+
+def piece_attacks(piece, square, occupied):
+    bitboard = 0b1 << square
+    if piece == chess.QUEEN:
+        return chess.bishop_table_attacks(bitboard, occupied) | chess.rook_table_attacks(bitboard, occupied)
+    if piece == chess.ROOK:
+        return chess.rook_table_attacks(bitboard, occupied)
+    if piece == chess.PAWN:
+        return chess.PAWN_ATTACKS[chess.WHITE][bitboard]
+
+def king_attacks(square):
+    return chess.KING_ATTACKS[0b1 << square]
+
+def piece_squares(piece):
+    return PAWN_SQUARES if piece == chess.PAWN else SQUARES
+
+def is_legal(piece, strong_to_move, strong_king, weak_king, piece_square):
+    '''Three distinct squares, kings apart, and the side that just moved is not in check.'''
+    if strong_king == weak_king or piece_square in (strong_king, weak_king) or \
+       king_attacks(strong_king) & (0b1 << weak_king):
+        return False
+    if strong_to_move:
+        occupied = (0b1 << strong_king) | (0b1 << weak_king)
+        return not piece_attacks(piece, piece_square, occupied) & (0b1 << weak_king)
+    return True
+
+def weak_king_moves(piece, strong_king, weak_king, piece_square):
+    '''
+    Squares the lone king can move to, taking the piece when the other king does not defend it,
+    and whether it is in check.
+    '''
+    guarded = king_attacks(strong_king) | piece_attacks(piece, piece_square, (0b1 << strong_king) | (0b1 << piece_square))
+    return [ king_attacks(weak_king) & chess.nnot(guarded | (0b1 << strong_king)), bool(guarded & (0b1 << weak_king)) ]
+
+def piece_unmoves(piece, strong_king, weak_king, piece_square):
+    '''Squares the piece can have come from.'''
+    occupied = (0b1 << strong_king) | (0b1 << weak_king) | (0b1 << piece_square)
+    if piece != chess.PAWN:
+        return piece_attacks(piece, piece_square, occupied) & chess.nnot(occupied)
+    origins = 0
+    if piece_square >= 16 and not occupied & (0b1 << (piece_square - 8)):
+        origins |= 0b1 << (piece_square - 8)
+        if piece_square >> 3 == 3 and not occupied & (0b1 << (piece_square - 16)):
+            origins |= 0b1 << (piece_square - 16)
+    return origins
+
+def solve(piece, queen_table=None):
+    '''
+    Returns the table of one ending as a bytearray indexed by chess.tablebase_index:
+    0 for draws and illegal positions, otherwise 1 + the number of plies to mate.
+    '''
+    values = bytearray(chess.TABLEBASE_SIZE)
+    move_counts = bytearray(chess.TABLEBASE_SIZE)
+    frontier = []
+    promotions = {} # plies: strong-to-move positions that win by promoting
+
+    for strong_king in SQUARES:
+        for weak_king in SQUARES:
+            for piece_square in piece_squares(piece):
+                if not is_legal(piece, False, strong_king, weak_king, piece_square):
+                    continue
+                [moves, in_check] = weak_king_moves(piece, strong_king, weak_king, piece_square)
+                index = chess.tablebase_index(False, strong_king, weak_king, piece_square)
+                move_counts[index] = chess.count_pieces(moves)
+                if not moves and in_check:
+                    values[index] = 1
+                    frontier.append(index)
+
+                # a pawn about to promote wins if the lone king loses the queen ending
+                if piece == chess.PAWN and piece_square >> 3 == 6 and \
+                   piece_square + 8 not in (strong_king, weak_king) and \
+                   is_legal(piece, True, strong_king, weak_king, piece_square):
+                    value = queen_table[chess.tablebase_index(False, strong_king, weak_king, piece_square + 8)]
+                    if value and (value - 1) % 2 == 0:
+                        promotions.setdefault(value, []).append(chess.tablebase_index(True, strong_king, weak_king, piece_square))
+
+    plies = 0
+    while frontier or promotions:
+        next_frontier = []
+        if plies % 2 == 0:
+            # lone king to move and lost: every legal way of reaching it wins for the strong side
+            for index in frontier:
+                [strong_king, weak_king, piece_square] = [ (index >> shift) & 63 for shift in (12, 6, 0) ]
+                predecessors = [ (chess.bb2index(origin), piece_square) for origin in chess.single_gen(king_attacks(strong_king)) ] + \
+                               [ (strong_king, chess.bb2index(origin)) for origin in chess.single_gen(piece_unmoves(piece, strong_king, weak_king, piece_square)) ]
+                for (king_from, piece_from) in predecessors:
+                    if not is_legal(piece, True, king_from, weak_king, piece_from):
+                        continue
+                    predecessor = chess.tablebase_index(True, king_from, weak_king, piece_from)
+                    if not values[predecessor]:
+                        values[predecessor] = plies + 2
+                        next_frontier.append(predecessor)
+            for predecessor in promotions.pop(plies + 1, []):
+                if not values[predecessor]:
+                    values[predecessor] = plies + 2
+                    next_frontier.append(predecessor)
+        else:
+            # strong side to move and winning: a lone king position is lost once all its moves lead to wins
+            for index in frontier:
+                [strong_king, weak_king, piece_square] = [ (index >> shift) & 63 for shift in (12, 6, 0) ]
+                for origin in chess.single_gen(king_attacks(weak_king)):
+                    origin = chess.bb2index(origin)
+                    if not is_legal(piece, False, strong_king, origin, piece_square):
+                        continue
+                    predecessor = chess.tablebase_index(False, strong_king, origin, piece_square)
+                    if values[predecessor]:
+                        continue
+                    move_counts[predecessor] -= 1
+                    if move_counts[predecessor] == 0:
+                        values[predecessor] = plies + 2
+                        next_frontier.append(predecessor)
+        frontier = next_frontier
+        plies += 1
+    return values
+
+def generate(path=chess.TABLEBASE_FILE):
+    tables = {}
+    for piece in chess.TABLEBASE_PIECES:
+        tables[piece] = solve(piece, tables.get(chess.QUEEN))
+        wins = sum(1 for value in tables[piece][:chess.TABLEBASE_SIZE//2] if value)
+        print('{}: {} winning positions with the strong side to move, longest mate {} plies'.format(
+              'K' + chess.piece2str(chess.WHITE|piece) + 'K', wins, max(tables[piece]) - 1))
+    with open(path, 'wb') as tablebase_file:
+        tablebase_file.write(zlib.compress(b''.join(bytes(tables[piece]) for piece in chess.TABLEBASE_PIECES), 9))
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generates the endgame tablebase.')
+    parser.add_argument('-o', '--output', default=chess.TABLEBASE_FILE, help='tablebase to write (default: {})'.format(chess.TABLEBASE_FILE))
+    args = parser.parse_args()
+    generate(args.output)
@@ -12,7 +12,8 @@ from copy import deepcopy
 pygame.init()
 
 SQUARE_SIDE = 50
-AI_SEARCH_DEPTH = 2
+AI_SEARCH_DEPTH = 4
+AI_TIME_BUDGET = 3 # seconds; the deepest search finished in time is played
 
 RED_CHECK          = (240, 150, 150)
 WHITE              = (255, 255, 255)
@@ -145,13 +146,13 @@ def set_title(title):
     
 def make_AI_move(game, color):
     set_title(SCREEN_TITLE + ' - Calculating move...')
-    new_game = chess.make_move(game, chess.get_AI_move(game, AI_SEARCH_DEPTH))
+    new_game = chess.make_move(game, chess.get_AI_move(game, AI_SEARCH_DEPTH, AI_TIME_BUDGET))
     set_title(SCREEN_TITLE)
     print_board(new_game.board, color)
     return new_game
 
 def try_move(game, attempted_move):
-    for move in chess.legal_moves(game, game.to_move):
+    for move in chess.generate_legal_moves(game, game.to_move):
         if move == attempted_move:
             game = chess.make_move(game, move)
     return game
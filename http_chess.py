@@ -63,7 +63,7 @@ class HttpServer:
             if waiting_player is None:
                 game_id = str(uuid.uuid4())
                 game = chess.Game()
-                self.sessions[game_id] = {'game': game, 'players': {'white': player_id, 'black': None}, 'last_update': time.time()}
+                self.sessions[game_id] = {'game': game, 'lock': threading.Lock(), 'players': {'white': player_id, 'black': None}, 'last_update': time.time()}
                 waiting_player = {'game_id': game_id, 'player_id': player_id}
                 return self.response(200, 'OK', json.dumps({'status': 'waiting', 'game_id': game_id, 'color': 'white'}), {'Content-type': 'application/json'})
             else:
@@ -92,8 +92,11 @@ class HttpServer:
         end_time = time.time() + 25
         while time.time() < end_time:
             game_obj = game_session['game']
-            fair_outcome = chess.get_outcome(game_obj) if chess.game_ended(game_obj) else None
-            if fair_outcome: return self.response(200, 'OK', json.dumps({'status': 'update', 'fen': game_obj.to_FEN(), 'outcome': fair_outcome}), {'Content-Type': 'application/json'})
+            # legality checks push/pop on the shared game, so reads take the session lock too
+            with game_session['lock']:
+                fair_outcome = chess.status(game_obj).outcome
+                current_fen = game_obj.to_FEN()
+            if fair_outcome: return self.response(200, 'OK', json.dumps({'status': 'update', 'fen': current_fen, 'outcome': fair_outcome}), {'Content-Type': 'application/json'})
             
             if requesting_player_id and game_session['players']['black'] is not None:
                 my_color, opponent_id, opponent_color = None, None, None
@@ -106,22 +109,28 @@ class HttpServer:
                     last_seen_opponent = game_session.get('last_poll', {}).get(opponent_id, game_session['last_update'])
                     if time.time() - last_seen_opponent > PLAYER_TIMEOUT_SECONDS:
                         timeout_outcome = f"Opponent ({opponent_color}) timed out. You win!"
-                        return self.response(200, 'OK', json.dumps({'status':'update', 'fen':game_obj.to_FEN(), 'outcome':timeout_outcome}), {'Content-Type':'application/json'})
+                        return self.response(200, 'OK', json.dumps({'status':'update', 'fen':current_fen, 'outcome':timeout_outcome}), {'Content-Type':'application/json'})
             
             player_black_joined = game_session['players']['black'] is not None and last_known_fen is None
-            board_changed = last_known_fen is not None and game_obj.to_FEN() != last_known_fen
+            board_changed = last_known_fen is not None and current_fen != last_known_fen
             if player_black_joined or board_changed: break
             time.sleep(0.2)
         
         game_obj = game_session['game']
-        outcome = chess.get_outcome(game_obj) if chess.game_ended(game_obj) else None
-        return self.response(200, 'OK', json.dumps({'status':'update', 'fen':game_obj.to_FEN(), 'turn':'white' if game_obj.to_move == chess.WHITE else 'black', 'outcome':outcome}), {'Content-Type':'application/json'})
+        with game_session['lock']:
+            outcome = chess.status(game_obj).outcome
+            fen, turn = game_obj.to_FEN(), 'white' if game_obj.to_move == chess.WHITE else 'black'
+        return self.response(200, 'OK', json.dumps({'status':'update', 'fen':fen, 'turn':turn, 'outcome':outcome}), {'Content-Type':'application/json'})
 
     def handle_move(self, params):
         game_id, player_id, move_str = params.get('game_id', [None])[0], params.get('player_id', [None])[0], params.get('move', [None])[0]
         if not all([game_id, player_id, move_str]) or game_id not in self.sessions: return self.response(400, 'Bad Request', b'Missing/invalid params')
         
         session = self.sessions[game_id]
+        with session['lock']:
+            return self.apply_move(session, game_id, player_id, move_str)
+
+    def apply_move(self, session, game_id, player_id, move_str):
         game = session['game']
         current_color_str = 'white' if game.to_move == chess.WHITE else 'black'
         if session['players'].get(current_color_str) != player_id:
@@ -129,13 +138,13 @@ class HttpServer:
         
         try:
             move = chess.str2bb(move_str[:2]), chess.str2bb(move_str[2:])
-            if move not in list(chess.legal_moves(game, game.to_move)): raise ValueError
+            if move not in list(chess.generate_legal_moves(game, game.to_move)): raise ValueError
         except (ValueError, IndexError):
             return self.response(400, 'Bad Request', json.dumps({'error': 'Illegal move', 'fen': game.to_FEN()}), {'Content-Type': 'application/json'})
         
         logging.info(f"[Game: {game_id}] Player {player_id} makes valid move: {move_str}")
-        session['game'] = chess.make_move(game, move)
+        game.push(move)
         session['last_update'] = time.time()
         
-        outcome = chess.get_outcome(session['game']) if chess.game_ended(session['game']) else None
-        return self.response(200, 'OK', json.dumps({'status':'update', 'fen':session['game'].to_FEN(), 'turn':'white' if session['game'].to_move == chess.WHITE else 'black', 'outcome':outcome}), {'Content-Type':'application/json'})
\ No newline at end of file
+        outcome = chess.status(game).outcome
+        return self.response(200, 'OK', json.dumps({'status':'update', 'fen':game.to_FEN(), 'turn':'white' if game.to_move == chess.WHITE else 'black', 'outcome':outcome}), {'Content-Type':'application/json'})
\ No newline at end of file
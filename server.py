@@ -17,6 +17,8 @@ class GameSession:
     """Represents a single chess game between two players."""
     def __init__(self, player1_thread, player2_thread):
         self.game_state = chess.Game()
+        # legality checks push/pop moves on game_state, so a move is handled under this lock
+        self.lock = threading.Lock()
         self.players = {
             chess.WHITE: player1_thread,
             chess.BLACK: player2_thread
@@ -76,55 +78,56 @@ class ProcessTheClient(threading.Thread):
                 self.send_message("ERROR Not in a game.")
                 return
 
-            if self.game_session.game_state.to_move != self.color:
-                self.send_message("ERROR Not your turn.")
-                return
+            with self.game_session.lock:
+                if self.game_session.game_state.to_move != self.color:
+                    self.send_message("ERROR Not your turn.")
+                    return
 
-            move_uci = parts[1]
-            logging.info(f"--- DEBUG: Received move UCI: {move_uci} from {self.address} ---")
+                move_uci = parts[1]
+                logging.info(f"--- DEBUG: Received move UCI: {move_uci} from {self.address} ---")
 
-            try:
-                leaving_square_str = move_uci[:2]
-                arriving_square_str = move_uci[2:]
-                player_move_tuple = (chess.str2bb(leaving_square_str), chess.str2bb(arriving_square_str))
-                logging.info(f"--- DEBUG: Parsed to move tuple: {player_move_tuple} ---")
-
-                is_legal = False
-                for legal_move in chess.legal_moves(self.game_session.game_state, self.color):
-                    if legal_move == player_move_tuple:
-                        is_legal = True
-                        break
+                try:
+                    leaving_square_str = move_uci[:2]
+                    arriving_square_str = move_uci[2:]
+                    player_move_tuple = (chess.str2bb(leaving_square_str), chess.str2bb(arriving_square_str))
+                    logging.info(f"--- DEBUG: Parsed to move tuple: {player_move_tuple} ---")
+
+                    is_legal = False
+                    for legal_move in chess.generate_legal_moves(self.game_session.game_state, self.color):
+                        if legal_move == player_move_tuple:
+                            is_legal = True
+                            break
                 
-                logging.info(f"--- DEBUG: Is the move legal? {is_legal} ---")
-                if not is_legal:
-                    self.send_message(f"ERROR Invalid or illegal move: {move_uci}")
-                    return
+                    logging.info(f"--- DEBUG: Is the move legal? {is_legal} ---")
+                    if not is_legal:
+                        self.send_message(f"ERROR Invalid or illegal move: {move_uci}")
+                        return
 
-                # --- THE FIX IS HERE ---
+                    # --- THE FIX IS HERE ---
                 
-                # 1. Apply the legal move
-                self.game_session.game_state = chess.make_move(self.game_session.game_state, player_move_tuple)
+                    # 1. Apply the legal move
+                    self.game_session.game_state.push(player_move_tuple)
                 
-                # 2. Get the new state
-                new_fen = self.game_session.game_state.to_FEN()
-                logging.info(f"--- DEBUG: Sending new FEN: {new_fen} ---")
-
-                # 3. ALWAYS send the new board state to both players
-                self.send_message(f"STATE {new_fen}")
-                self.game_session.get_opponent(self.color).send_message(f"STATE {new_fen}")
-
-                # 4. NOW, check if the game has ended
-                if chess.game_ended(self.game_session.game_state):
-                    outcome = chess.get_outcome(self.game_session.game_state)
-                    logging.info(f"--- DEBUG: Game ended. Outcome: {outcome} ---")
+                    # 2. Get the new state
+                    new_fen = self.game_session.game_state.to_FEN()
+                    logging.info(f"--- DEBUG: Sending new FEN: {new_fen} ---")
+
+                    # 3. ALWAYS send the new board state to both players
+                    self.send_message(f"STATE {new_fen}")
+                    self.game_session.get_opponent(self.color).send_message(f"STATE {new_fen}")
+
+                    # 4. NOW, check if the game has ended
+                    if chess.game_ended(self.game_session.game_state):
+                        outcome = chess.get_outcome(self.game_session.game_state)
+                        logging.info(f"--- DEBUG: Game ended. Outcome: {outcome} ---")
                     
-                    # Send the final outcome message to both players
-                    self.send_message(f"GAME_END {outcome}")
-                    self.game_session.get_opponent(self.color).send_message(f"GAME_END {outcome}")
+                        # Send the final outcome message to both players
+                        self.send_message(f"GAME_END {outcome}")
+                        self.game_session.get_opponent(self.color).send_message(f"GAME_END {outcome}")
 
-            except Exception as e:
-                logging.error(f"Error processing move: {e}")
-                self.send_message(f"ERROR Could not process move {move_uci}")
+                except Exception as e:
+                    logging.error(f"Error processing move: {e}")
+                    self.send_message(f"ERROR Could not process move {move_uci}")
         else:
             self.send_message("ERROR Unknown command.")
             